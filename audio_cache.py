@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+from metrics import CACHE_TOTAL
+
+logger = logging.getLogger('MusicBot')
+
+# Сколько байт с начала и конца файла участвует в контрольной сумме
+DIGEST_CHUNK = 1024 * 1024
+
+
+def file_digest(path):
+    """Быстрая контрольная сумма: размер, начало и конец файла"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(DIGEST_CHUNK))
+        if size > DIGEST_CHUNK:
+            f.seek(max(DIGEST_CHUNK, size - DIGEST_CHUNK))
+            digest.update(f.read(DIGEST_CHUNK))
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """Постоянный кэш аудио по ID видео с LRU-вытеснением по размеру.
+
+    Файлы лежат в folder, индекс - в хранилище состояния. Записи, выданные
+    get и put, закреплены до release: трек ждет отправки, и вытеснение
+    их пропускает.
+    """
+
+    def __init__(self, folder, max_bytes, store):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._pins = {}
+        os.makedirs(folder, exist_ok=True)
+        self._entries = self._load()
+
+    def _load(self):
+        entries = OrderedDict()
+        try:
+            for video_id, data in self.store.query('SELECT video_id, data FROM audio_cache ORDER BY last_used'):
+                entries[video_id] = json.loads(data)
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса аудиокэша: {e}")
+        return entries
+
+    def _save_entry(self, video_id):
+        entry = self._entries[video_id]
+        self.store.execute(
+            'INSERT OR REPLACE INTO audio_cache (video_id, data, last_used) VALUES (?, ?, ?)',
+            (video_id, json.dumps(entry, ensure_ascii=False), entry['last_used'])
+        )
+
+    def _path(self, name):
+        return os.path.join(self.folder, name) if name else None
+
+    def _remove_entry(self, video_id):
+        entry = self._entries.pop(video_id, None)
+        if not entry:
+            return
+        self.store.execute('DELETE FROM audio_cache WHERE video_id = ?', (video_id,))
+        for name in (entry.get('audio'), entry.get('thumb')):
+            path = self._path(name)
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                logger.error(f"Ошибка удаления файла кэша {path}: {e}")
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self._entries.values())
+        for video_id in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if video_id in self._pins:
+                continue
+            total -= self._entries[video_id]['size']
+            self._remove_entry(video_id)
+            logger.info(f"Аудиокэш: вытеснен {video_id}")
+
+    def _is_valid(self, entry):
+        audio_path = self._path(entry['audio'])
+        if not os.path.exists(audio_path) or os.path.getsize(audio_path) != entry['audio_size']:
+            return False
+        thumb_path = self._path(entry.get('thumb'))
+        if thumb_path and not os.path.exists(thumb_path):
+            return False
+        return file_digest(audio_path) == entry['digest']
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def contains(self, video_id):
+        with self._lock:
+            return video_id in self._entries
+
+    def get(self, video_id):
+        """Возвращает пути к закэшированным файлам или None"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry and not self._is_valid(entry):
+                logger.warning(f"Аудиокэш: файл {video_id} поврежден, удаляем")
+                self._remove_entry(video_id)
+                entry = None
+
+            if not entry:
+                self.misses += 1
+                CACHE_TOTAL.inc('audio', 'miss')
+                logger.info(f"Аудиокэш: промах {video_id} (hit rate {self.hit_rate:.0%})")
+                return None
+
+            self.hits += 1
+            CACHE_TOTAL.inc('audio', 'hit')
+            entry['last_used'] = time.time()
+            self._entries.move_to_end(video_id)
+            self._save_entry(video_id)
+            self._pin(video_id)
+            logger.info(f"Аудиокэш: попадание {video_id} (hit rate {self.hit_rate:.0%})")
+            return {
+                'audio_path': self._path(entry['audio']),
+                'thumb_path': self._path(entry.get('thumb'))
+            }
+
+    def put(self, video_id, audio_path, thumb_path=None):
+        """Перемещает скачанные файлы в кэш и возвращает новые пути"""
+        with self._lock:
+            self._remove_entry(video_id)
+
+            audio_name = f"{video_id}{os.path.splitext(audio_path)[1]}"
+            shutil.move(audio_path, self._path(audio_name))
+            thumb_name = None
+            if thumb_path and os.path.exists(thumb_path):
+                thumb_name = f"{video_id}{os.path.splitext(thumb_path)[1]}"
+                shutil.move(thumb_path, self._path(thumb_name))
+
+            audio_size = os.path.getsize(self._path(audio_name))
+            thumb_size = os.path.getsize(self._path(thumb_name)) if thumb_name else 0
+            self._entries[video_id] = {
+                'audio': audio_name,
+                'thumb': thumb_name,
+                'audio_size': audio_size,
+                'size': audio_size + thumb_size,
+                'digest': file_digest(self._path(audio_name)),
+                'last_used': time.time()
+            }
+            self._save_entry(video_id)
+            self._pin(video_id)
+            self._evict()
+            return {
+                'audio_path': self._path(audio_name),
+                'thumb_path': self._path(thumb_name)
+            }
+
+    def _pin(self, video_id):
+        self._pins[video_id] = self._pins.get(video_id, 0) + 1
+
+    def release(self, video_id):
+        """Снимает закрепление, взятое get или put; отложенное вытеснение выполняется сейчас"""
+        with self._lock:
+            if (count := self._pins.get(video_id, 0)) > 1:
+                self._pins[video_id] = count - 1
+                return
+            if self._pins.pop(video_id, None) is not None:
+                self._evict()
@@ -0,0 +1,255 @@
+import time
+from collections import deque
+from threading import Event
+from concurrent.futures import ThreadPoolExecutor
+from music_bot import (
+    CONFIG,
+    logger,
+    get_state_store,
+    get_job_journal,
+    get_track_selector,
+    get_retry_policy,
+    begin_job,
+    journal_prepare,
+    resume_jobs,
+    resume_track,
+    finish_job,
+    unpin_track,
+    remove_track_files,
+    YouTubeMusicParser,
+    TrackDownloader,
+    TelegramSender
+)
+from job_journal import UPLOADED
+from retry import RetryLater
+from scheduler import RateLimiter
+from metrics import TRACKS_TOTAL
+
+# Результат _prepare при остановке: трек не обработан, позиция не сдвигается
+STOPPED = object()
+
+
+class Backfill:
+    """Заливка всего плейлиста (или его среза) в канал по порядку.
+
+    Треки скачиваются параллельно в пределах окна, а отправляются строго
+    в порядке плейлиста через общий лимит частоты Telegram. Позиция после
+    каждой отправки сохраняется, поэтому повторный запуск продолжает с места
+    остановки.
+    """
+
+    # Как часто писать в лог прогресс, секунд
+    PROGRESS_INTERVAL = 30
+
+    def __init__(self, playlist, channel=None, start=None, stop=None, workers=None):
+        self.playlist = playlist
+        self.channel = channel or CONFIG['telegram_channel']
+        # start=None - продолжить с сохраненной позиции
+        self.start = start
+        self.stop_at = stop
+        self.workers = workers or CONFIG['download_workers']
+        self.rate_limiter = RateLimiter(CONFIG['channel_min_interval'], CONFIG['global_max_per_second'])
+        self.sent = 0
+        self.done = 0
+        self.failed = []
+        # Заполняются в run() из журнала и списка недоступных треков
+        self._posted = set()
+        self._resume = {}
+        self._dead_ids = set()
+        self._stop_event = Event()
+
+    def stop(self):
+        """Просит заливку завершиться после текущего трека"""
+        self._stop_event.set()
+
+    def load_position(self):
+        rows = get_state_store().query(
+            'SELECT position FROM backfill WHERE channel = ? AND url = ?', (self.channel, self.playlist)
+        )
+        return rows[0][0] if rows else 0
+
+    def save_position(self, position):
+        store = get_state_store()
+        store.execute(
+            'INSERT OR REPLACE INTO backfill (channel, url, position, updated_at) VALUES (?, ?, ?, ?)',
+            (self.channel, self.playlist, position, time.time())
+        )
+        # Позиция - единственная защита от повторной отправки при новом запуске
+        store.flush()
+
+    def run(self):
+        """Заливает треки до конца среза или вызова stop(); True - все обработано"""
+        self._stop_event.clear()
+        if not (tracks := YouTubeMusicParser.get_tracks_from_url(self.playlist)):
+            logger.error(f"Заливка: не удалось получить треки {self.playlist}")
+            return False
+
+        start = self.load_position() if self.start is None else self.start
+        stop = len(tracks) if self.stop_at is None else min(self.stop_at, len(tracks))
+        if start >= stop:
+            logger.info(f"Заливка в {self.channel}: нечего отправлять (позиция {start} из {stop})")
+            return True
+
+        # Принятые Telegram до сбоя треки не отправляются повторно,
+        # а скачанные переиспользуются, когда до них дойдет очередь
+        journal = get_job_journal()
+        self._posted = {record['track'].get('id') for record in journal.pending(self.channel) if record['state'] == UPLOADED}
+        self._resume = {record['track'].get('id'): record for record in resume_jobs(self.channel)}
+        self._dead_ids = TrackDownloader.get_dead_tracks().dead_ids()
+
+        total = stop - start
+        logger.info(f"Заливка в {self.channel}: треки {start}-{stop - 1} ({total}), загрузок параллельно: {self.workers}")
+        started = time.monotonic()
+        last_report = started
+        pending = deque()
+        positions = iter(range(start, stop))
+        stopped = False
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix='backfill')
+        try:
+            # Окно в два раза больше пула: пока отправляется один трек, следующие уже качаются
+            for position in positions:
+                pending.append((position, pool.submit(self._prepare, tracks[position])))
+                if len(pending) >= self.workers * 2:
+                    break
+
+            def take():
+                position, future = pending.popleft()
+                if (next_position := next(positions, None)) is not None:
+                    pending.append((next_position, pool.submit(self._prepare, tracks[next_position])))
+                return position, future
+
+            while pending and not stopped:
+                if self._stop_event.is_set():
+                    stopped = True
+                    break
+                group = [take()]
+                # В альбом добавляются следующие по порядку треки, только если они уже готовы
+                while len(group) < CONFIG['batch_size'] and pending and pending[0][1].done():
+                    group.append(take())
+
+                outcomes = {}
+                ready = []
+                for position, future in group:
+                    if tracks[position].get('id') in self._posted:
+                        logger.info(f"Заливка: трек {position} уже отправлен до сбоя")
+                        outcomes[position] = 'posted'
+                    elif (track_data := future.result()) is STOPPED:
+                        outcomes[position] = None
+                    elif track_data:
+                        ready.append((position, track_data))
+                    else:
+                        outcomes[position] = False
+                if ready:
+                    results = self._send_all([track_data for _, track_data in ready])
+                    for (position, track_data), success in zip(ready, results):
+                        outcomes[position] = success
+                        if success is False:
+                            remove_track_files(track_data)
+                        elif success is None:
+                            unpin_track(track_data)
+
+                for position, _ in group:
+                    if (success := outcomes[position]) is None:
+                        # Остановка во время ожидания: трек остается в журнале
+                        stopped = True
+                        break
+                    if success is True:
+                        self.sent += 1
+                        TRACKS_TOTAL.inc('sent')
+                    elif success is False:
+                        self.failed.append(position)
+                        TRACKS_TOTAL.inc('failed')
+                    self.save_position(position + 1)
+                    self.done += 1
+
+                if time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                    self.report(total, started)
+                    last_report = time.monotonic()
+        finally:
+            self._stop_event.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            # Скачанные, но не отправленные треки остаются в журнале до следующего запуска
+            for _, future in pending:
+                if not future.cancelled() and isinstance(track_data := future.result(), dict):
+                    unpin_track(track_data)
+            self.report(total, started)
+            if self.failed:
+                logger.warning(f"Заливка: не отправлены треки на позициях {self.failed}")
+        return not stopped
+
+    def _prepare(self, track):
+        if self._stop_event.is_set():
+            return STOPPED
+        if track.get('id') in self._posted:
+            return None
+        try:
+            if record := self._resume.pop(track.get('id'), None):
+                return self._retrying(resume_track, record)
+            if track.get('id') in self._dead_ids:
+                logger.info(f"Заливка: трек недоступен, пропускаем: {track['artist']} - {track['title']}")
+                return None
+            return self._retrying(journal_prepare, track, begin_job(track, self.channel))
+        except Exception as e:
+            logger.error(f"Заливка: ошибка загрузки {track.get('artist')} - {track.get('title')}: {e}")
+            return None
+
+    def _retrying(self, prepare, *args):
+        """Вызывает prepare, выдерживая отложенные повторы: порядок важнее скорости"""
+        while True:
+            try:
+                return prepare(*args)
+            except RetryLater as e:
+                logger.info(f"Заливка: {e}")
+                if self._stop_event.wait(e.delay):
+                    return STOPPED
+                prepare, args = resume_track, (e.record,)
+
+    def _send_all(self, batch):
+        """Отправляет готовые треки альбомом или по одному; успехи в порядке batch"""
+        if len(batch) == 1:
+            return [self._send(batch[0])]
+        self.rate_limiter.acquire(self.channel, self._stop_event)
+        if self._stop_event.is_set():
+            return [None] * len(batch)
+        # Неотправленные альбомом треки идут через _send: с лимитом частоты и один раз
+        results = TelegramSender.send_batch(batch, chat_id=self.channel, fallback=False)
+        for index, (track_data, success) in enumerate(zip(batch, results)):
+            if success:
+                self._confirm(track_data)
+            else:
+                results[index] = self._send(track_data)
+        return results
+
+    def _confirm(self, track_data):
+        get_track_selector().history.add(self.channel, track_data)
+        finish_job(track_data, True)
+
+    def _send(self, track_data):
+        """Отправляет трек, пережидая ограничение частоты; None - остановлено"""
+        policy = get_retry_policy(f'telegram:{self.channel}')
+        for attempt in range(CONFIG['max_retries']):
+            self.rate_limiter.acquire(self.channel, self._stop_event)
+            if self._stop_event.is_set():
+                return None
+            if TelegramSender.send_track(track_data, chat_id=self.channel):
+                self._confirm(track_data)
+                return True
+            # Порядок важнее скорости: при ограничении ждем, а не переходим к следующему
+            if not (wait := policy.breaker.wait_time()):
+                break
+            logger.info(f"Заливка: Telegram ограничил частоту, ждем {wait:.0f} с")
+            self._stop_event.wait(wait)
+            if self._stop_event.is_set():
+                return None
+        finish_job(track_data, False)
+        return False
+
+    def report(self, total, started):
+        """Прогресс в лог: обработано, скорость в треках в минуту и оценка остатка"""
+        elapsed = time.monotonic() - started
+        rate = self.sent / elapsed * 60 if elapsed else 0
+        eta = f", осталось ~{(total - self.done) / rate:.0f} мин" if rate and self.done < total else ""
+        logger.info(
+            f"Заливка в {self.channel}: {self.done}/{total}, отправлено {self.sent}, ошибок {len(self.failed)}, "
+            f"{rate:.1f} треков/мин{eta}"
+        )
@@ -0,0 +1,400 @@
+"""Офлайн-бенчмарк конвейера: извлечение плейлиста, скачивание и отправка.
+
+YouTube и Telegram заменены локальными двойниками: экстрактор yt-dlp отдает
+синтетический плейлист нужного размера, HTTP-сервер раздает сгенерированное
+аудио (с поддержкой Range) и изображает Bot API. Работают настоящие
+YouTubeMusicParser, TrackDownloader и TelegramSender, поэтому замеры
+сравнимы между версиями. Нужен ffmpeg (для режима ytdlp - и ffprobe).
+
+Каждое сочетание размера плейлиста и параллельности запускается в отдельном
+процессе, чтобы пиковый RSS не смешивался.
+
+Запуск из корня репозитория:
+    python3 benchmarks/pipeline_bench.py --playlist-sizes 100,5000 --concurrency 1,4 --tracks 20
+    python3 benchmarks/pipeline_bench.py --mode chunked --size-mb 8 --telegram-latency 0.2
+    python3 benchmarks/pipeline_bench.py --output base.json
+    python3 benchmarks/pipeline_bench.py --baseline base.json --tolerance 0.2
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import itertools
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+STAGES = ('extract', 'select', 'download', 'upload', 'track')
+TOKEN = '123456:bench'
+
+
+def make_media(path, size_mb, bitrate=128):
+    """Синтетический opus/webm примерно заданного размера"""
+    duration = max(1, int(size_mb * 1024 * 1024 * 8 / (bitrate * 1000)))
+    subprocess.run(
+        [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'anoisesrc=d={duration}:a=0.1',
+            '-c:a', 'libopus', '-b:a', f'{bitrate}k', path
+        ],
+        check=True
+    )
+    return duration
+
+
+class BackendHandler(BaseHTTPRequestHandler):
+    """Аудио, обложки и Bot API на одном локальном сервере"""
+
+    protocol_version = 'HTTP/1.1'
+    media = b''
+    duration = 0
+    telegram_latency = 0.0
+    file_ids = itertools.count()
+
+    def send_body(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/audio/'):
+            self.serve_media()
+        elif self.path.startswith('/thumb/'):
+            # Минимальный заголовок JPEG: содержимое обложки бенчмарку не важно
+            self.send_body(200, b'\xff\xd8\xff\xe0' + bytes(4096), 'image/jpeg')
+        elif self.path.startswith('/bot'):
+            self.serve_telegram()
+        else:
+            self.send_body(404, b'', 'text/plain')
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        self.serve_telegram()
+
+    def serve_media(self):
+        media = self.media
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if not match:
+            self.send_body(200, media, 'audio/webm', [('Accept-Ranges', 'bytes')])
+            return
+        start = int(match[1])
+        end = min(int(match[2]) if match[2] else len(media) - 1, len(media) - 1)
+        self.send_body(
+            206,
+            media[start:end + 1],
+            'audio/webm',
+            [('Content-Range', f'bytes {start}-{end}/{len(media)}'), ('Accept-Ranges', 'bytes')]
+        )
+
+    def serve_telegram(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.telegram_latency:
+            time.sleep(self.telegram_latency)
+        method = self.path.rsplit('/', 1)[-1].split('?', 1)[0]
+        message = {'message_id': next(self.file_ids), 'date': int(time.time()), 'chat': {'id': -1, 'type': 'channel'}}
+        if method == 'sendAudio':
+            file_id = f'bench-{message["message_id"]}'
+            message['audio'] = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'duration': self.duration,
+                'thumbnail': {'file_id': f'{file_id}-thumb', 'file_unique_id': f'{file_id}-thumb', 'width': 320, 'height': 320}
+            }
+        body = json.dumps({'ok': True, 'result': message}).encode()
+        self.send_body(200, body, 'application/json')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMusicIE(InfoExtractor):
+    """Плейлисты /playlist/<размер> и треки /watch/<id> локального сервера"""
+
+    IE_NAME = 'fakemusic'
+    _VALID_URL = r'(?P<base>http://127\.0\.0\.1:\d+)/(?P<kind>playlist|watch)/(?P<id>[^/?#]+)'
+
+    def _real_extract(self, url):
+        base, kind, item_id = self._match_valid_url(url).group('base', 'kind', 'id')
+        if kind == 'playlist':
+            entries = [
+                {
+                    '_type': 'url',
+                    'ie_key': self.ie_key(),
+                    'id': f'trk{index:06d}',
+                    'title': f'Artist {index % 97} - Track {index}',
+                    'duration': BackendHandler.duration,
+                    'url': f'{base}/watch/trk{index:06d}'
+                }
+                for index in range(int(item_id))
+            ]
+            return self.playlist_result(entries, item_id, 'Benchmark playlist')
+
+        return {
+            'id': item_id,
+            'title': f'Bench - {item_id}',
+            'duration': BackendHandler.duration,
+            'thumbnail': f'{base}/thumb/{item_id}.jpg',
+            'formats': [{
+                'format_id': '251',
+                'url': f'{base}/audio/{item_id}.webm',
+                'ext': 'webm',
+                'acodec': 'opus',
+                'vcodec': 'none',
+                'abr': 128,
+                'filesize': len(BackendHandler.media)
+            }]
+        }
+
+
+class BenchYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL, в котором локальный экстрактор проверяется первым"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_info_extractor(FakeMusicIE())
+        key = FakeMusicIE.ie_key()
+        self._ies = {key: self._ies.pop(key), **self._ies}
+
+
+def percentiles(timings):
+    if not timings:
+        return None
+    timings = sorted(timings)
+    pick = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))]
+    return {'n': len(timings), 'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': timings[-1]}
+
+
+def run_single(args):
+    """Один прогон в текущем процессе; результат - строка JSON в stdout"""
+    workdir = tempfile.mkdtemp(prefix='musicbot-bench-')
+    os.chdir(workdir)
+
+    if args.source_file:
+        with open(args.source_file, 'rb') as f:
+            BackendHandler.media = f.read()
+        BackendHandler.duration = 180
+    else:
+        BackendHandler.duration = make_media('source.webm', args.size_mb)
+        with open('source.webm', 'rb') as f:
+            BackendHandler.media = f.read()
+    BackendHandler.telegram_latency = args.telegram_latency
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BackendHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    yt_dlp.YoutubeDL = BenchYoutubeDL
+
+    import telebot
+    from telebot import asyncio_helper
+    telebot.apihelper.API_URL = f'{base}/bot{{0}}/{{1}}'
+    asyncio_helper.API_URL = f'{base}/bot{{0}}/{{1}}'
+
+    import music_bot
+    from music_bot import CONFIG, YouTubeMusicParser, TelegramSender, choose_track, prepare_track, remove_track_files
+    from metrics import STAGE_SECONDS
+
+    CONFIG.update(
+        telegram_token=TOKEN,
+        telegram_channel='@bench',
+        temp_folder=os.path.join(workdir, 'temp'),
+        audio_cache_folder=os.path.join(workdir, 'audio_cache'),
+        state_db=os.path.join(workdir, 'state.db'),
+        use_cookies=False,
+        max_retries=1,
+        # Каждое извлечение идет мимо кэша снимков, как при плановом обновлении
+        playlist_cache_ttl=0,
+        chunked_download=args.mode == 'chunked',
+        stream_transcode=args.mode == 'stream'
+    )
+    os.makedirs(CONFIG['temp_folder'], exist_ok=True)
+    random.seed(args.seed)
+
+    timings = {stage: [] for stage in STAGES}
+    playlist_url = f'{base}/playlist/{args.playlist_size}'
+    tracks = None
+    for _ in range(args.extract_runs):
+        started = time.perf_counter()
+        tracks = YouTubeMusicParser.get_tracks_from_url(playlist_url)
+        timings['extract'].append(time.perf_counter() - started)
+    if not tracks:
+        raise SystemExit("Локальный экстрактор не вернул треков")
+
+    remaining = itertools.count()
+    failures = itertools.count()
+
+    def worker(index):
+        channel = f'@bench{index}'
+        while next(remaining) < args.tracks:
+            track_started = time.perf_counter()
+            track = choose_track(tracks, channel)
+            timings['select'].append(time.perf_counter() - track_started)
+
+            started = time.perf_counter()
+            track_data = prepare_track(track) if track else None
+            timings['download'].append(time.perf_counter() - started)
+            if not track_data:
+                next(failures)
+                continue
+
+            started = time.perf_counter()
+            if not TelegramSender.send_track(track_data, chat_id=channel):
+                next(failures)
+            timings['upload'].append(time.perf_counter() - started)
+            remove_track_files(track_data)
+            timings['track'].append(time.perf_counter() - track_started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    music_bot.get_state_store().close()
+    server.shutdown()
+    os.chdir('/')
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    sent = len(timings['track'])
+    transcode = next((series for labels, series in STAGE_SECONDS.samples() if labels == ('transcode',)), None)
+    result = {
+        'mode': args.mode,
+        'playlist_size': args.playlist_size,
+        'concurrency': args.concurrency,
+        'tracks': sent,
+        'failures': next(failures),
+        'wall_seconds': wall,
+        'tracks_per_hour': sent / wall * 3600 if wall else 0,
+        'stages': {stage: percentiles(values) for stage, values in timings.items()},
+        'transcode_mean': transcode[1] / transcode[2] if transcode else None,
+        # ru_maxrss в Linux - в килобайтах
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+    print(json.dumps(result))
+
+
+def run_matrix(args):
+    results = []
+    for playlist_size, concurrency in itertools.product(args.playlist_sizes, args.concurrency_levels):
+        command = [
+            sys.executable, os.path.abspath(__file__), '--single',
+            '--mode', args.mode,
+            '--playlist-size', str(playlist_size),
+            '--concurrency', str(concurrency),
+            '--tracks', str(args.tracks),
+            '--size-mb', str(args.size_mb),
+            '--telegram-latency', str(args.telegram_latency),
+            '--extract-runs', str(args.extract_runs),
+            '--seed', str(args.seed)
+        ]
+        if args.source_file:
+            command += ['--source-file', os.path.abspath(args.source_file)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            raise SystemExit(f"Прогон {playlist_size}x{concurrency} завершился с ошибкой")
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        report(results[-1])
+    return results
+
+
+def report(result):
+    print(
+        f"\nплейлист {result['playlist_size']}, параллельно {result['concurrency']}, режим {result['mode']}: "
+        f"{result['tracks']} треков за {result['wall_seconds']:.1f} с = {result['tracks_per_hour']:.0f} треков/час, "
+        f"ошибок {result['failures']}, пиковый RSS {result['peak_rss_mb']:.0f} МБ"
+    )
+    for stage, stats in result['stages'].items():
+        if stats:
+            print(
+                f"  {stage:<9} n={stats['n']:<5} p50 {stats['p50'] * 1000:9.1f} ms   "
+                f"p95 {stats['p95'] * 1000:9.1f} ms   p99 {stats['p99'] * 1000:9.1f} ms"
+            )
+    if result['transcode_mean'] is not None:
+        print(f"  transcode среднее {result['transcode_mean'] * 1000:.1f} ms")
+
+
+def compare(results, baseline_path, tolerance):
+    """Сравнивает пропускную способность и p95 с сохраненным прогоном"""
+    with open(baseline_path) as f:
+        baseline = {(r['mode'], r['playlist_size'], r['concurrency']): r for r in json.load(f)}
+
+    regressions = []
+    for result in results:
+        key = (result['mode'], result['playlist_size'], result['concurrency'])
+        if not (old := baseline.get(key)):
+            continue
+        if result['tracks_per_hour'] < old['tracks_per_hour'] * (1 - tolerance):
+            regressions.append(f"{key}: треков/час {old['tracks_per_hour']:.0f} -> {result['tracks_per_hour']:.0f}")
+        for stage, stats in result['stages'].items():
+            old_stats = old['stages'].get(stage)
+            if stats and old_stats and stats['p95'] > old_stats['p95'] * (1 + tolerance):
+                regressions.append(f"{key}: p95 {stage} {old_stats['p95'] * 1000:.1f} -> {stats['p95'] * 1000:.1f} ms")
+
+    if regressions:
+        print("\nРегрессии относительно базового прогона:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nРегрессий относительно базового прогона нет")
+    return 0
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('ytdlp', 'chunked', 'stream'), default='ytdlp', help="способ скачивания")
+    parser.add_argument('--playlist-sizes', type=int_list, default=[100, 1000])
+    parser.add_argument('--concurrency', dest='concurrency_levels', type=int_list, default=[1, 4])
+    parser.add_argument('--tracks', type=int, default=20, help="треков на прогон")
+    parser.add_argument('--size-mb', type=float, default=4, help="размер синтетического аудио")
+    parser.add_argument('--source-file', help="готовый аудиофайл вместо синтетического")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument('--extract-runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="допустимое ухудшение, доля")
+    # Внутренние параметры одиночного прогона
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--playlist-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        args.concurrency = args.concurrency_levels[0]
+        run_single(args)
+        return 0
+
+    print(f"yt-dlp {yt_dlp.version.__version__}, режим {args.mode}, треков на прогон: {args.tracks}")
+    results = run_matrix(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        return compare(results, args.baseline, args.tolerance)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Микробенчмарк: новый YoutubeDL на каждый вызов против пула экземпляров.
+
+Запуск из корня репозитория:
+    python3 benchmarks/ydl_pool_bench.py --iterations 200 --cookies 2000
+    python3 benchmarks/ydl_pool_bench.py --url 'https://music.youtube.com/playlist?list=...'
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from ydl_pool import YDLPool
+
+
+def write_cookie_file(path, count):
+    """Синтетический cookies.txt в формате Netscape"""
+    with open(path, 'w') as f:
+        f.write("# Netscape HTTP Cookie File\n")
+        for i in range(count):
+            f.write(f".youtube.com\tTRUE\t/\tTRUE\t2145916800\tcookie{i}\tvalue{i}\n")
+
+
+def make_opts(cookiefile):
+    opts = {
+        'extract_flat': True,
+        'quiet': True,
+        'extractor_args': {'youtube': {'skip': ['authcheck'], 'music': True}}
+    }
+    if cookiefile:
+        opts['cookiefile'] = cookiefile
+    return opts
+
+
+def measure(iterations, action):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+    print(
+        f"{name:<8} mean {statistics.mean(timings) * 1000:8.2f} ms   "
+        f"median {statistics.median(timings) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--cookies', type=int, default=1000, help="число cookies в синтетическом файле (0 - без файла)")
+    parser.add_argument('--url', help="плейлист для сравнения с реальным извлечением (нужна сеть)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cookiefile = None
+        if args.cookies:
+            cookiefile = os.path.join(tmp, 'cookies.txt')
+            write_cookie_file(cookiefile, args.cookies)
+        opts = make_opts(cookiefile)
+
+        def cold():
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                # Обращение к cookiejar заставляет yt-dlp прочитать файл, как при первом запросе
+                ydl.cookiejar
+                if args.url:
+                    ydl.extract_info(args.url, download=False)
+
+        pool = YDLPool()
+
+        def pooled():
+            with pool.acquire('extract', opts) as ydl:
+                ydl.cookiejar
+                if args.url:
+                    ydl.extract_info(args.url, download=False)
+
+        iterations = min(args.iterations, 5) if args.url else args.iterations
+        print(f"yt-dlp {yt_dlp.version.__version__}, итераций: {iterations}, cookies: {args.cookies}")
+        cold_timings = measure(iterations, cold)
+        pooled_timings = measure(iterations, pooled)
+        report('cold', cold_timings)
+        report('pooled', pooled_timings)
+        print(f"ускорение: x{statistics.mean(cold_timings) / statistics.mean(pooled_timings):.1f}")
+        pool.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import logging
+from contextlib import suppress
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('MusicBot')
+
+
+class ChunkedDownloadError(Exception):
+    pass
+
+
+class BandwidthLimiter:
+    """Общий на все загрузки лимит скорости (token bucket), 0 - без ограничения"""
+
+    def __init__(self, bytes_per_second=0):
+        self.rate = bytes_per_second
+        self._lock = Lock()
+        self._allowance = 0.0
+        self._last = time.monotonic()
+
+    def consume(self, amount):
+        """Блокирует поток, пока не наберется разрешение на amount байт"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Запас не больше секунды трафика, чтобы не было всплесков после простоя
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= amount
+            delay = -self._allowance / self.rate if self._allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def probe_size(url, headers, timeout, session=requests):
+    """Размер файла по ответу на запрос первого байта"""
+    response = session.get(url, headers={**headers, 'Range': 'bytes=0-0'}, stream=True, timeout=timeout)
+    response.close()
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    raise ChunkedDownloadError("Сервер не поддерживает загрузку по диапазонам")
+
+
+class ChunkedDownloader:
+    """Параллельная загрузка файла диапазонами байтов с докачкой после перезапуска.
+
+    Рядом с файлом хранятся <dest>.part (данные) и <dest>.part.json (готовые
+    диапазоны), поэтому после перезапуска скачиваются только недостающие куски.
+    """
+
+    def __init__(self, connections=4, chunk_size=1024 * 1024, limiter=None, timeout=30):
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.limiter = limiter or BandwidthLimiter()
+        self.timeout = timeout
+        # Одна сессия на загрузчик: куски идут по уже открытым keep-alive соединениям
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _load_state(self, state_path, part_path, size):
+        if not (os.path.exists(state_path) and os.path.exists(part_path)):
+            return set()
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('size') == size and state.get('chunk_size') == self.chunk_size:
+                return set(state['done'])
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать состояние докачки {state_path}: {e}")
+        return set()
+
+    def _save_state(self, state_path, size, done):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'chunk_size': self.chunk_size, 'done': sorted(done)}, f)
+        os.replace(tmp_path, state_path)
+
+    def _fetch_chunk(self, url, headers, fd, index, size, stop):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, size) - 1
+        with self.session.get(
+            url,
+            headers={**headers, 'Range': f"bytes={start}-{end}"},
+            stream=True,
+            timeout=self.timeout
+        ) as response:
+            if response.status_code != 206:
+                raise ChunkedDownloadError(f"Ожидался ответ 206, получен {response.status_code}")
+            offset = start
+            for block in response.iter_content(64 * 1024):
+                if stop.is_set():
+                    raise ChunkedDownloadError(f"Кусок {index} прерван")
+                self.limiter.consume(len(block))
+                os.pwrite(fd, block, offset)
+                offset += len(block)
+        if offset != end + 1:
+            raise ChunkedDownloadError(f"Кусок {index} получен не полностью")
+
+    def download(self, url, dest, headers=None, size=None):
+        """Скачивает url в dest и возвращает dest"""
+        headers = headers or {}
+        size = size or probe_size(url, headers, self.timeout, self.session)
+        part_path = f"{dest}.part"
+        state_path = f"{part_path}.json"
+
+        done = self._load_state(state_path, part_path, size)
+        chunks = [index for index in range((size + self.chunk_size - 1) // self.chunk_size) if index not in done]
+        if done:
+            logger.info(f"Докачка {os.path.basename(dest)}: осталось {len(chunks)} из {len(chunks) + len(done)} кусков")
+
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+        state_lock = Lock()
+        stop = Event()
+        try:
+            os.ftruncate(fd, size)
+
+            def worker(index):
+                if stop.is_set():
+                    return
+                self._fetch_chunk(url, headers, fd, index, size, stop)
+                with state_lock:
+                    done.add(index)
+                    self._save_state(state_path, size, done)
+
+            pool = ThreadPoolExecutor(self.connections, thread_name_prefix='chunk')
+            try:
+                finished, _ = wait([pool.submit(worker, index) for index in chunks], return_when=FIRST_EXCEPTION)
+                for future in finished:
+                    future.result()
+            except BaseException:
+                # Первая ошибка прерывает загрузку: очередь отменяется, идущие куски
+                # останавливаются; готовые куски останутся для докачки
+                stop.set()
+                raise
+            finally:
+                # Потоки пишут в fd, поэтому ждем их до закрытия файла
+                pool.shutdown(wait=True, cancel_futures=True)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        os.replace(part_path, dest)
+        # Файл без кусков (пустой) состояние не записывает
+        with suppress(FileNotFoundError):
+            os.remove(state_path)
+        return dest
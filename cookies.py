@@ -1,40 +1,86 @@
-import sqlite3
+import os
 import sys
+import json
+import sqlite3
+
+# Хосты cookies, нужных yt-dlp; точка в начале - cookie для всех поддоменов.
+# Точные значения host_key, а не LIKE, чтобы запрос шел по индексу Chrome
+YOUTUBE_HOSTS = (
+    'youtube.com', 'www.youtube.com', 'music.youtube.com', 'm.youtube.com', 'accounts.youtube.com',
+    'google.com', 'www.google.com', 'accounts.google.com'
+)
+HOST_KEYS = tuple(prefix + host for host in YOUTUBE_HOSTS for prefix in ('', '.'))
+
+# Разница между эпохой Chrome (1601 год, микросекунды) и Unix
+CHROME_EPOCH_OFFSET = 11644473600
+
+
+def source_stamp(db_path):
+    """Размер и mtime базы и ее WAL: при их совпадении содержимое не менялось"""
+    stamp = {}
+    for path in (db_path, f"{db_path}-wal"):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamp[os.path.basename(path)] = [stat.st_mtime_ns, stat.st_size]
+    return {'db': os.path.abspath(db_path), 'files': stamp}
 
-def export_cookies(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # SQL-запрос БЕЗ комментариев с '#'
-    cursor.execute("""
-        SELECT 
-            host_key,
-            CASE 
-                WHEN substr(host_key,1,1) = '.' THEN 'TRUE' 
-                ELSE 'FALSE' 
-            END,
-            path,
-            CASE 
-                WHEN is_secure = 1 THEN 'TRUE' 
-                ELSE 'FALSE' 
-            END,
-            (expires_utc / 1000000) - 11644473600,  -- Конвертация времени (через '--')
-            name,
-            value
-        FROM cookies
-    """)
-
-    with open('cookies.txt', 'w') as f:
+
+def export_cookies(db_path, output='cookies.txt'):
+    """Выгружает cookies YouTube и Google в формате Netscape.
+
+    Возвращает число выгруженных cookies или None, если база с прошлой
+    выгрузки не менялась и файл оставлен как есть.
+    """
+    stamp_path = f"{output}.source"
+    stamp = source_stamp(db_path)
+    if os.path.exists(output) and os.path.exists(stamp_path):
+        with open(stamp_path, 'r', encoding='utf-8') as f:
+            try:
+                if json.load(f) == stamp:
+                    return None
+            except ValueError:
+                pass
+
+    # Только чтение: браузер может держать базу открытой
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT
+                host_key,
+                CASE WHEN substr(host_key, 1, 1) = '.' THEN 'TRUE' ELSE 'FALSE' END,
+                path,
+                CASE WHEN is_secure = 1 THEN 'TRUE' ELSE 'FALSE' END,
+                CASE WHEN expires_utc = 0 THEN 0 ELSE (expires_utc / 1000000) - {CHROME_EPOCH_OFFSET} END,
+                name,
+                value
+            FROM cookies
+            WHERE host_key IN ({', '.join('?' * len(HOST_KEYS))})
+            """,
+            HOST_KEYS
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # Запись через временный файл: бот перечитывает cookies на лету и не должен увидеть половину
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, 'w') as f:
         f.write("# Netscape HTTP Cookie File\n")
-        for row in cursor:
+        for row in rows:
             f.write("\t".join(map(str, row)) + "\n")
-
-    conn.close()
+    os.replace(tmp_path, output)
+    with open(stamp_path, 'w', encoding='utf-8') as f:
+        json.dump(stamp, f)
+    return len(rows)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Использование: python3 cookies.py <path-to-chrome-cookies-db>")
+        print("Использование: python3 cookies.py <path-to-chrome-cookies-db> [cookies.txt]")
         sys.exit(1)
-        
-    export_cookies(sys.argv[1])
-    print("Cookies успешно экспортированы в cookies.txt")
+
+    output = sys.argv[2] if len(sys.argv) > 2 else 'cookies.txt'
+    count = export_cookies(sys.argv[1], output)
+    if count is None:
+        print(f"База cookies не менялась, {output} не перезаписан")
+    else:
+        print(f"Cookies успешно экспортированы в {output}: {count}")
@@ -0,0 +1,88 @@
+import re
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger('MusicBot')
+
+# Классы постоянных ошибок yt-dlp и признаки в тексте ошибки
+FAILURE_PATTERNS = [
+    ('age_gated', re.compile(r'confirm your age|age[- ]restricted|inappropriate for some users', re.I)),
+    ('region_blocked', re.compile(r'available in your country|blocked it in your country|geo[- ]?restrict', re.I)),
+    ('unavailable', re.compile(
+        r'video unavailable|video is (?:no longer|not) available|private video|'
+        r'has been removed|account associated with this video has been terminated|'
+        r'video has been deleted', re.I
+    ))
+]
+
+# Предел роста срока блокировки при повторных ошибках
+MAX_TTL = 30 * 24 * 3600
+
+
+def classify_failure(error):
+    """Возвращает класс постоянной ошибки или None для временных"""
+    message = str(error)
+    for failure_class, pattern in FAILURE_PATTERNS:
+        if pattern.search(message):
+            return failure_class
+    return None
+
+
+class DeadTrackList:
+    """Постоянный список недоступных видео с отдельным сроком для каждого класса ошибки"""
+
+    def __init__(self, store, ttls):
+        self.store = store
+        self.ttls = ttls
+        self._lock = Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        entries = {}
+        try:
+            for video_id, failure_class, count, until, reason in self.store.query(
+                'SELECT video_id, class, count, until, reason FROM failures'
+            ):
+                entries[video_id] = {'class': failure_class, 'count': count, 'until': until, 'reason': reason}
+        except Exception as e:
+            logger.error(f"Ошибка чтения списка недоступных треков: {e}")
+        return entries
+
+    def add(self, video_id, failure_class, reason=''):
+        """Блокирует видео; при повторных ошибках срок удваивается"""
+        with self._lock:
+            entry = self._entries.get(video_id, {'count': 0})
+            count = entry['count'] + 1
+            ttl = min(self.ttls.get(failure_class, 86400) * 2 ** (count - 1), MAX_TTL)
+            entry = {
+                'class': failure_class,
+                'count': count,
+                'until': time.time() + ttl,
+                'reason': reason[:200]
+            }
+            self._entries[video_id] = entry
+            self.store.execute(
+                'INSERT OR REPLACE INTO failures (video_id, class, count, until, reason) VALUES (?, ?, ?, ?, ?)',
+                (video_id, failure_class, count, entry['until'], entry['reason'])
+            )
+        logger.warning(f"Трек {video_id} исключен на {ttl // 3600} ч ({failure_class})")
+
+    def dead_ids(self):
+        """Множество ID, заблокированных на текущий момент"""
+        now = time.time()
+        with self._lock:
+            # Истекшие записи хранятся еще MAX_TTL, чтобы повторная ошибка удвоила срок
+            forgotten = [video_id for video_id, entry in self._entries.items() if entry['until'] + MAX_TTL <= now]
+            if forgotten:
+                for video_id in forgotten:
+                    del self._entries[video_id]
+                self.store.executemany('DELETE FROM failures WHERE video_id = ?', [(video_id,) for video_id in forgotten])
+            return {video_id for video_id, entry in self._entries.items() if entry['until'] > now}
+
+    def filter(self, tracks):
+        """Убирает из списка заблокированные треки"""
+        dead = self.dead_ids()
+        if not dead:
+            return tracks
+        return [track for track in tracks if track.get('id') not in dead]
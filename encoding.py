@@ -0,0 +1,89 @@
+import os
+import math
+import logging
+import subprocess
+from collections import namedtuple
+from stream_transcode import CODECS, StreamTranscodeError
+
+logger = logging.getLogger('MusicBot')
+
+# Запас на контейнер, теги и неточность битрейта энкодера
+CONTAINER_OVERHEAD = 0.03
+# Ниже этого битрейта ffmpeg-энкодеры звучат неприемлемо
+FLOOR_BITRATE = 32
+
+# name: copy, copy_split, default, fit или split; bitrate - None при копировании
+EncodingProfile = namedtuple('EncodingProfile', 'name codec copy_audio bitrate split')
+
+
+def usable_bytes(max_bytes):
+    return max_bytes * (1 - CONTAINER_OVERHEAD)
+
+
+def estimate_bytes(duration, bitrate):
+    """Размер аудио заданной длительности и битрейта (кбит/с)"""
+    return duration * bitrate * 1000 / 8
+
+
+def choose_profile(duration, codec, bitrate, max_bytes, min_bitrate=64, split=False, acodec=None, source_bytes=None, source_bitrate=None):
+    """Выбирает профиль кодирования трека по длительности и источнику.
+
+    Совпадающий кодек источника копируется без перекодирования, если
+    помещается в max_bytes. Иначе битрейт снижается до влезающего в лимит,
+    но не ниже min_bitrate; если и этого мало, при split трек кодируется
+    с обычным битрейтом и потом режется на части.
+    """
+    if acodec and codec in CODECS and acodec.startswith(CODECS[codec][1]):
+        if source_bytes is None and source_bitrate and duration:
+            source_bytes = estimate_bytes(duration, source_bitrate)
+        if source_bytes is None or source_bytes <= usable_bytes(max_bytes):
+            return EncodingProfile('copy', codec, True, None, False)
+        if split:
+            return EncodingProfile('copy_split', codec, True, None, True)
+
+    if not duration:
+        return EncodingProfile('default', codec, False, bitrate, False)
+
+    budget = usable_bytes(max_bytes) * 8 / duration / 1000
+    if budget >= bitrate:
+        return EncodingProfile('default', codec, False, bitrate, False)
+    # Битрейт кратен 8 кбит/с, как принимают энкодеры
+    fitted = int(budget // 8 * 8)
+    if fitted >= min_bitrate:
+        return EncodingProfile('fit', codec, False, fitted, False)
+    if split:
+        return EncodingProfile('split', codec, False, bitrate, True)
+    logger.warning(f"Трек длиной {duration} с не помещается в лимит даже при {min_bitrate} кбит/с")
+    return EncodingProfile('fit', codec, False, max(FLOOR_BITRATE, fitted), False)
+
+
+def split_audio(path, duration, max_bytes, out_dir):
+    """Режет файл на части не больше max_bytes без перекодирования.
+
+    Части пишутся в out_dir, исходный файл не меняется. Возвращает список
+    путей к частям или [path], если файл и так помещается.
+    """
+    size = os.path.getsize(path)
+    if size <= max_bytes or not duration:
+        return [path]
+
+    parts = math.ceil(size / usable_bytes(max_bytes))
+    segment_time = math.ceil(duration / parts)
+    base, ext = os.path.splitext(os.path.basename(path))
+    pattern = os.path.join(out_dir, f"{base}.seg%02d{ext}")
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', path,
+        '-f', 'segment', '-segment_time', str(segment_time), '-c', 'copy', '-map', '0:a', pattern
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    paths = []
+    index = 0
+    while os.path.exists(part := pattern % index):
+        paths.append(part)
+        index += 1
+    if result.returncode != 0 or not paths:
+        for part in paths:
+            os.remove(part)
+        raise StreamTranscodeError(f"ffmpeg не смог разрезать {path}: {result.stderr.decode(errors='replace').strip()}")
+    logger.info(f"Трек разрезан на {len(paths)} частей по {segment_time} с")
+    return paths
@@ -0,0 +1,161 @@
+import time
+from collections import deque
+from threading import Thread, Event
+from music_bot import (
+    CONFIG,
+    logger,
+    cleanup_temp_files,
+    choose_track,
+    begin_job,
+    journal_prepare,
+    resume_jobs,
+    resume_track,
+    finish_job,
+    unpin_track,
+    get_retry_policy,
+    YouTubeMusicParser,
+    TelegramSender
+)
+from prefetch import TrackPrefetcher
+from retry import RetryLater
+from metrics import STAGE_SECONDS, TRACKS_TOTAL
+
+
+class BotEngine:
+    """Цикл отправки треков, не зависящий от интерфейса"""
+
+    def __init__(self, on_track=None):
+        # on_track(track_data) вызывается перед отправкой каждого трека
+        self.on_track = on_track
+        self._stop_event = Event()
+        self._thread = None
+        # Незавершенные отправки из журнала, их досылаем первыми
+        self._resume = deque()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Запускает цикл в фоновом потоке"""
+        self._stop_event.clear()
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Просит цикл завершиться после текущего шага"""
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def prefetch_track(self):
+        """Выбирает и скачивает следующий трек для очереди предзагрузки"""
+        try:
+            return self._prefetch_track()
+        except RetryLater as e:
+            # Отложенный трек скачивается первым после паузы
+            self._resume.appendleft(e.record)
+            raise
+
+    def _prefetch_track(self):
+        while self._resume:
+            if track_data := resume_track(self._resume.popleft()):
+                return track_data
+
+        logger.info("Собираем треки из YouTube Music...")
+
+        if not (tracks := YouTubeMusicParser.get_tracks_from_url(CONFIG['youtube_url'])):
+            logger.warning("Не удалось получить треки")
+            return None
+
+        logger.info(f"Найдено треков: {len(tracks)}")
+        # Недоступный трек сразу попадает в черный список, поэтому
+        # вместо долгого ожидания пробуем выбрать другой
+        for _ in range(3):
+            if not (track := choose_track(tracks)):
+                return None
+            logger.info(f"Выбран трек: {track['artist']} - {track['title']}")
+
+            if track_data := journal_prepare(track, begin_job(track)):
+                return track_data
+            logger.warning("Ошибка загрузки трека")
+        return None
+
+    @staticmethod
+    def keep_track(track_data):
+        """Неотправленный при остановке трек остается в журнале до следующего запуска"""
+        logger.info(f"Трек отложен до следующего запуска: {track_data['artist']} - {track_data['title']}")
+        unpin_track(track_data)
+
+    def run(self):
+        """Выполняет цикл отправки до вызова stop()"""
+        self._stop_event.clear()
+        cleanup_temp_files()
+        self._resume = deque(resume_jobs(CONFIG['telegram_channel']))
+
+        prefetcher = TrackPrefetcher(
+            self.prefetch_track,
+            self.keep_track,
+            # Альбом собирается из уже готовых треков
+            max(CONFIG['prefetch_depth'], CONFIG['batch_size']),
+            retry_delay=get_retry_policy('youtube').next_delay
+        )
+        prefetcher.start()
+        next_post = time.monotonic()
+        idle_since = None
+        failures = 0
+
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    # Ждем запланированного момента отправки
+                    if time.monotonic() < next_post:
+                        self._stop_event.wait(min(1, next_post - time.monotonic()))
+                        continue
+
+                    if idle_since is not None:
+                        STAGE_SECONDS.observe(time.monotonic() - idle_since, 'sleep')
+                        idle_since = None
+
+                    if not (track_data := prefetcher.get(timeout=1)):
+                        continue
+                    batch = [track_data]
+                    # Остальные треки альбома берем только из уже скачанных, не дожидаясь новых
+                    while len(batch) < CONFIG['batch_size'] and (track_data := prefetcher.get(timeout=0)):
+                        batch.append(track_data)
+
+                    if self.on_track:
+                        for track_data in batch:
+                            self.on_track(track_data)
+
+                    if len(batch) > 1:
+                        results = TelegramSender.send_batch(batch)
+                    else:
+                        results = [TelegramSender.send_track(batch[0])]
+                    for track_data, success in zip(batch, results):
+                        finish_job(track_data, success)
+                        if success:
+                            TRACKS_TOTAL.inc('sent')
+                        else:
+                            TRACKS_TOTAL.inc('failed')
+                            logger.warning("Ошибка отправки трека")
+
+                    # Следующая отправка отсчитывается от расписания, а не от конца загрузки
+                    next_post = max(next_post + CONFIG['check_interval'], time.monotonic())
+                    idle_since = time.monotonic()
+                    failures = 0
+                    logger.info(f"Ожидание {CONFIG['check_interval']//60} минут...")
+
+                except Exception as e:
+                    failures += 1
+                    delay = get_retry_policy('youtube').backoff.delay(failures - 1)
+                    logger.error(f"Ошибка в основном цикле: {e}. Повтор через {delay:.0f} с")
+                    next_post = time.monotonic() + delay
+        finally:
+            prefetcher.stop(timeout=30)
+            logger.info("Цикл отправки завершен")
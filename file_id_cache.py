@@ -0,0 +1,47 @@
+import logging
+from threading import Lock
+
+logger = logging.getLogger('MusicBot')
+
+
+class FileIdCache:
+    """Соответствие ID видео -> file_id аудио и обложки в Telegram.
+
+    file_id действителен только для бота, который его получил,
+    поэтому записи хранятся отдельно для каждого бота.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = Lock()
+        self._data = self._load()
+
+    def _load(self):
+        data = {}
+        try:
+            for bot_id, video_id, audio, thumb in self.store.query('SELECT bot_id, video_id, audio, thumb FROM file_ids'):
+                data.setdefault(bot_id, {})[video_id] = {'audio': audio, 'thumb': thumb}
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша file_id: {e}")
+        return data
+
+    def get(self, bot_id, video_id):
+        """Возвращает {'audio': ..., 'thumb': ...} или None"""
+        with self._lock:
+            return self._data.get(bot_id, {}).get(video_id)
+
+    def put(self, bot_id, video_id, audio_file_id, thumb_file_id=None):
+        with self._lock:
+            self._data.setdefault(bot_id, {})[video_id] = {
+                'audio': audio_file_id,
+                'thumb': thumb_file_id
+            }
+            self.store.execute(
+                'INSERT OR REPLACE INTO file_ids (bot_id, video_id, audio, thumb) VALUES (?, ?, ?, ?)',
+                (bot_id, video_id, audio_file_id, thumb_file_id)
+            )
+
+    def remove(self, bot_id, video_id):
+        with self._lock:
+            if self._data.get(bot_id, {}).pop(video_id, None):
+                self.store.execute('DELETE FROM file_ids WHERE bot_id = ? AND video_id = ?', (bot_id, video_id))
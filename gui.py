@@ -0,0 +1,370 @@
+import os
+import logging
+import tkinter as tk
+from tkinter import ttk, scrolledtext, messagebox, filedialog
+from threading import Thread
+from collections import deque
+from music_bot import (
+    CONFIG,
+    DEFAULT_CONFIG,
+    logger,
+    add_log_handler,
+    validate_telegram_token,
+    cleanup_temp_files,
+    choose_track,
+    prepare_track,
+    finish_job,
+    YouTubeMusicParser,
+    TelegramSender
+)
+from engine import BotEngine
+from metrics import summary
+
+# Строки, ожидающие вывода в окно; при отставании GUI старые отбрасываются
+log_lines = deque(maxlen=CONFIG['gui_log_lines'])
+
+class RingBufferHandler(logging.Handler):
+    def __init__(self, lines):
+        super().__init__()
+        self.lines = lines
+    
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+class MusicBotGUI:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("YT Music Telegram Bot")
+        self.root.geometry("900x650")
+        self.engine = BotEngine(
+            on_track=lambda data: self.root.after(0, lambda: self.update_last_track(data))
+        )
+        
+        self.setup_ui()
+        self.update_logs()
+        self.update_metrics()
+        self.load_config()
+
+    def setup_ui(self):
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+
+        # Вкладка управления
+        self.control_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.control_frame, text="Управление")
+        self.setup_control_tab()
+
+        # Вкладка настроек
+        self.settings_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.settings_frame, text="Настройки")
+        self.setup_settings_tab()
+
+        # Вкладка логов
+        self.log_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.log_frame, text="Логи")
+        self.setup_log_tab()
+
+        # Вкладка метрик
+        self.metrics_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.metrics_frame, text="Метрики")
+        self.setup_metrics_tab()
+
+    def setup_control_tab(self):
+        self.start_button = ttk.Button(
+            self.control_frame,
+            text="Запустить бота",
+            command=self.start_bot
+        )
+        self.start_button.pack(pady=10, padx=20, fill=tk.X)
+
+        self.stop_button = ttk.Button(
+            self.control_frame,
+            text="Остановить бота",
+            command=self.stop_bot,
+            state=tk.DISABLED
+        )
+        self.stop_button.pack(pady=10, padx=20, fill=tk.X)
+
+        ttk.Button(
+            self.control_frame,
+            text="Тестовая отправка",
+            command=self.test_send
+        ).pack(pady=10, padx=20, fill=tk.X)
+
+        self.status_label = ttk.Label(
+            self.control_frame,
+            text="Статус: Бот остановлен",
+            font=('Arial', 10, 'bold')
+        )
+        self.status_label.pack(pady=10)
+
+        self.last_track_frame = ttk.LabelFrame(
+            self.control_frame,
+            text="Последний трек",
+            padding=10
+        )
+        self.last_track_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
+        
+        self.last_track_label = ttk.Label(
+            self.last_track_frame,
+            text="Еще не отправлено ни одного трека",
+            wraplength=500
+        )
+        self.last_track_label.pack(fill=tk.BOTH, expand=True)
+
+    def setup_settings_tab(self):
+        # Настройки Telegram
+        telegram_frame = ttk.LabelFrame(self.settings_frame, text="Настройки Telegram", padding=10)
+        telegram_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(telegram_frame, text="Токен бота:").grid(row=0, column=0, sticky=tk.W)
+        self.token_entry = ttk.Entry(telegram_frame, width=50)
+        self.token_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
+        
+        ttk.Label(telegram_frame, text="ID канала:").grid(row=1, column=0, sticky=tk.W)
+        self.channel_entry = ttk.Entry(telegram_frame, width=50)
+        self.channel_entry.grid(row=1, column=1, sticky=tk.EW, padx=5)
+
+        # Настройки YouTube Music
+        youtube_frame = ttk.LabelFrame(self.settings_frame, text="Настройки YouTube Music", padding=10)
+        youtube_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(youtube_frame, text="URL плейлиста:").grid(row=0, column=0, sticky=tk.W)
+        self.youtube_url_entry = ttk.Entry(youtube_frame, width=50)
+        self.youtube_url_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
+        
+        self.use_cookies_var = tk.BooleanVar()
+        ttk.Checkbutton(
+            youtube_frame,
+            text="Использовать cookies",
+            variable=self.use_cookies_var
+        ).grid(row=1, column=0, sticky=tk.W)
+        
+        ttk.Label(youtube_frame, text="Файл cookies:").grid(row=2, column=0, sticky=tk.W)
+        self.cookies_entry = ttk.Entry(youtube_frame, width=40)
+        self.cookies_entry.grid(row=2, column=1, sticky=tk.EW, padx=5)
+        
+        ttk.Button(
+            youtube_frame,
+            text="Обзор...",
+            command=self.browse_cookies_file
+        ).grid(row=2, column=2, padx=5)
+
+        # Интервал отправки
+        interval_frame = ttk.LabelFrame(self.settings_frame, text="Интервал отправки", padding=10)
+        interval_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(interval_frame, text="Интервал (мин):").grid(row=0, column=0, sticky=tk.W)
+        self.interval_entry = ttk.Entry(interval_frame, width=10)
+        self.interval_entry.grid(row=0, column=1, sticky=tk.W, padx=5)
+
+        ttk.Label(interval_frame, text="Предзагрузка (треков):").grid(row=1, column=0, sticky=tk.W)
+        self.prefetch_entry = ttk.Entry(interval_frame, width=10)
+        self.prefetch_entry.grid(row=1, column=1, sticky=tk.W, padx=5)
+
+        # Кнопки сохранения
+        btn_frame = ttk.Frame(self.settings_frame)
+        btn_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Button(
+            btn_frame,
+            text="Сохранить настройки",
+            command=self.save_config
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="Сбросить к default",
+            command=self.reset_config
+        ).pack(side=tk.LEFT, padx=5)
+
+    def setup_log_tab(self):
+        self.log_text = scrolledtext.ScrolledText(
+            self.log_frame,
+            wrap=tk.WORD,
+            width=100,
+            height=25,
+            font=('Courier New', 9)
+        )
+        self.log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        ttk.Button(
+            self.log_frame,
+            text="Очистить логи",
+            command=self.clear_logs
+        ).pack(pady=5)
+
+    def setup_metrics_tab(self):
+        self.metrics_text = scrolledtext.ScrolledText(
+            self.metrics_frame,
+            wrap=tk.NONE,
+            width=100,
+            height=25,
+            font=('Courier New', 9)
+        )
+        self.metrics_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    def browse_cookies_file(self):
+        filepath = filedialog.askopenfilename(
+            title="Выберите файл cookies",
+            filetypes=(("Text files", "*.txt"), ("All files", "*.*"))
+        )
+        if filepath:
+            self.cookies_entry.delete(0, tk.END)
+            self.cookies_entry.insert(0, filepath)
+
+    def update_logs(self):
+        # Все накопившиеся строки вставляются одним вызовом
+        batch = []
+        while log_lines:
+            batch.append(log_lines.popleft())
+        if batch:
+            self.log_text.insert(tk.END, "\n".join(batch) + "\n")
+            # Окно хранит не больше gui_log_lines строк
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - CONFIG['gui_log_lines']
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+        self.root.after(500, self.update_logs)
+
+    def update_metrics(self):
+        self.metrics_text.delete('1.0', tk.END)
+        self.metrics_text.insert(tk.END, summary() or "Метрик пока нет")
+        self.root.after(2000, self.update_metrics)
+
+    def clear_logs(self):
+        self.log_text.delete(1.0, tk.END)
+
+    def load_config(self):
+        self.token_entry.insert(0, CONFIG['telegram_token'])
+        self.channel_entry.insert(0, CONFIG['telegram_channel'])
+        self.youtube_url_entry.insert(0, CONFIG['youtube_url'])
+        self.interval_entry.insert(0, str(CONFIG['check_interval'] // 60))
+        self.prefetch_entry.insert(0, str(CONFIG['prefetch_depth']))
+        self.use_cookies_var.set(CONFIG['use_cookies'])
+        self.cookies_entry.insert(0, CONFIG['cookies_file'])
+
+    def save_config(self):
+        try:
+            CONFIG.update({
+                'telegram_token': self.token_entry.get(),
+                'telegram_channel': self.channel_entry.get(),
+                'youtube_url': self.youtube_url_entry.get(),
+                'check_interval': int(self.interval_entry.get()) * 60,
+                'prefetch_depth': max(1, int(self.prefetch_entry.get())),
+                'use_cookies': self.use_cookies_var.get(),
+                'cookies_file': self.cookies_entry.get()
+            })
+            
+            if not validate_telegram_token(CONFIG['telegram_token']):
+                messagebox.showerror("Ошибка", "Неверный формат Telegram токена!")
+                return
+                
+            messagebox.showinfo("Успех", "Настройки сохранены!")
+            logger.info("Настройки обновлены")
+            
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте правильность значений!")
+            logger.error("Ошибка сохранения настроек")
+
+    def reset_config(self):
+        CONFIG.clear()
+        CONFIG.update(DEFAULT_CONFIG)
+        self.clear_settings_fields()
+        self.load_config()
+        messagebox.showinfo("Успех", "Настройки сброшены!")
+        logger.info("Настройки сброшены к default")
+
+    def clear_settings_fields(self):
+        self.token_entry.delete(0, tk.END)
+        self.channel_entry.delete(0, tk.END)
+        self.youtube_url_entry.delete(0, tk.END)
+        self.interval_entry.delete(0, tk.END)
+        self.prefetch_entry.delete(0, tk.END)
+        self.cookies_entry.delete(0, tk.END)
+        self.use_cookies_var.set(False)
+
+    def start_bot(self):
+        if not self.engine.running:
+            if not validate_telegram_token(CONFIG['telegram_token']):
+                messagebox.showerror("Ошибка", "Неверный формат Telegram токена!")
+                return
+
+            if self.engine.is_alive():
+                messagebox.showwarning("Внимание", "Бот еще завершает предзагрузку, попробуйте позже")
+                return
+                
+            self.start_button.config(state=tk.DISABLED)
+            self.stop_button.config(state=tk.NORMAL)
+            self.status_label.config(text="Статус: Бот запущен", foreground="green")
+            self.engine.start()
+            logger.info("Бот запущен")
+        else:
+            messagebox.showwarning("Внимание", "Бот уже запущен!")
+
+    def stop_bot(self):
+        self.engine.stop()
+        self.start_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Статус: Бот остановлен", foreground="red")
+        logger.info("Бот остановлен")
+
+    def test_send(self):
+        if not validate_telegram_token(CONFIG['telegram_token']):
+            messagebox.showerror("Ошибка", "Неверный формат Telegram токена!")
+            return
+            
+        if not CONFIG['youtube_url']:
+            messagebox.showerror("Ошибка", "Укажите URL плейлиста YouTube Music!")
+            return
+            
+        Thread(target=self._test_send, daemon=True).start()
+
+    def _test_send(self):
+        try:
+            logger.info("Начинаем тестовую отправку...")
+            
+            if not (tracks := YouTubeMusicParser.get_tracks_from_url(CONFIG['youtube_url'])):
+                messagebox.showerror("Ошибка", "Не удалось получить треки с YouTube Music!")
+                return
+                
+            if not (track := choose_track(tracks)):
+                messagebox.showerror("Ошибка", "Все треки плейлиста временно недоступны!")
+                return
+            logger.info(f"Выбран тестовый трек: {track['artist']} - {track['title']}")
+            
+            if track_data := prepare_track(track):
+                sent = TelegramSender.send_track(track_data)
+                finish_job(track_data, sent)
+                if sent:
+                    messagebox.showinfo("Успех", "Тестовая отправка выполнена!")
+                    logger.info("Тестовая отправка успешна")
+                else:
+                    messagebox.showerror("Ошибка", "Ошибка тестовой отправки")
+                    logger.error("Тестовая отправка не удалась")
+            else:
+                messagebox.showerror("Ошибка", "Не удалось загрузить трек")
+                logger.error("Ошибка загрузки трека")
+                
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при тестовой отправке: {str(e)}")
+            logger.error(f"Ошибка тестовой отправки: {e}")
+
+    def update_last_track(self, track):
+        duration = track.get('duration', 'N/A')
+        if isinstance(duration, int):
+            duration = f"{duration // 60}:{duration % 60:02d}"
+        self.last_track_label.config(
+            text=f"{track.get('artist', 'Unknown')} - {track.get('title', 'Unknown')}\nДлительность: {duration}"
+        )
+
+def run_gui():
+    """Запускает графический интерфейс"""
+    add_log_handler(RingBufferHandler(log_lines))
+
+    os.makedirs(CONFIG['temp_folder'], exist_ok=True)
+    root = tk.Tk()
+    app = MusicBotGUI(root)
+    root.mainloop()
+    app.engine.stop()
+    cleanup_temp_files()
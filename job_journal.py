@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+from threading import Thread, Condition, Event, Lock
+
+logger = logging.getLogger('MusicBot')
+
+# Состояния отправки по порядку; confirmed и dropped - конечные
+SELECTED = 'selected'
+DOWNLOADED = 'downloaded'
+UPLOADED = 'uploaded'
+CONFIRMED = 'confirmed'
+DROPPED = 'dropped'
+FINAL_STATES = (CONFIRMED, DROPPED)
+
+
+class JobJournal:
+    """Журнал предзаписи отправок в файле JSON Lines.
+
+    Каждая смена состояния - строка в конце файла. Строки копятся в памяти,
+    фоновый поток пишет их пачкой и делает один fsync на пачку; вызывающий,
+    которому нужна гарантия (например, после отправки в Telegram), ждет
+    ближайшего fsync. Завершенные отправки выбрасываются при сжатии:
+    файл переписывается заново только с незавершенными.
+    """
+
+    def __init__(self, path, sync_interval=0.05, compact_after=500):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        self._jobs = self._replay()
+        self._buffer = []
+        self._written = 0
+        self._synced = 0
+        self._finished = 0
+        # Кто-то ждет fsync: пачку пишем сразу, не дожидаясь соседей
+        self._urgent = False
+        self._condition = Condition()
+        self._io_lock = Lock()
+        self._closed = Event()
+        self._compact(list(self._jobs.values()))
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = Thread(target=self._sync_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _replay(self):
+        """Последнее состояние каждой отправки; оборванная при падении строка пропускается"""
+        jobs = {}
+        if not os.path.exists(self.path):
+            return jobs
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Журнал {self.path}: пропущена поврежденная строка {line_number}")
+                    continue
+                jobs.setdefault(record['job'], {'started': record['time']}).update(record)
+        unfinished = sum(1 for record in jobs.values() if record['state'] not in FINAL_STATES)
+        if unfinished:
+            logger.info(f"Журнал отправок: незавершенных заданий {unfinished}")
+        return {job: record for job, record in jobs.items() if record['state'] not in FINAL_STATES}
+
+    def begin(self, channel, track):
+        """Записывает выбор трека и возвращает ID задания"""
+        job = uuid.uuid4().hex
+        self._append({'job': job, 'channel': channel, 'track': track, 'state': SELECTED, 'time': time.time()})
+        return job
+
+    def advance(self, job, state, track_data=None, durable=False):
+        """Записывает новое состояние; durable - дождаться записи на диск"""
+        if not job:
+            return
+        record = {'job': job, 'state': state, 'time': time.time()}
+        if track_data is not None:
+            record['track_data'] = {key: value for key, value in track_data.items() if key != 'job_id'}
+        self._append(record, durable)
+
+    def pending(self, channel=None):
+        """Незавершенные задания канала в порядке выбора"""
+        with self._condition:
+            records = [dict(record) for record in self._jobs.values()]
+        if channel is not None:
+            records = [record for record in records if record.get('channel') == channel]
+        return sorted(records, key=lambda record: record['started'])
+
+    def artifacts(self):
+        """Файлы незавершенных заданий: их нельзя удалять при очистке"""
+        paths = set()
+        with self._condition:
+            for record in self._jobs.values():
+                track_data = record.get('track_data') or {}
+                paths.update(path for path in (track_data.get('audio_path'), track_data.get('thumb_path')) if path)
+        return {os.path.abspath(path) for path in paths}
+
+    def _append(self, record, durable=False):
+        with self._condition:
+            if record['state'] == SELECTED:
+                self._jobs[record['job']] = dict(record, started=record['time'])
+            elif record['state'] in FINAL_STATES:
+                if self._jobs.pop(record['job'], None) is not None:
+                    self._finished += 1
+            elif record['job'] in self._jobs:
+                self._jobs[record['job']].update(record)
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            self._written += 1
+            sequence = self._written
+            if durable:
+                self._urgent = True
+            self._condition.notify_all()
+            if durable:
+                while self._synced < sequence and not self._closed.is_set():
+                    self._condition.wait(1)
+
+    def _sync_loop(self):
+        while not self._closed.is_set():
+            with self._condition:
+                if not self._buffer:
+                    self._condition.wait(1)
+                if self._buffer and not self._urgent:
+                    # Пауза собирает в одну пачку записи соседних потоков
+                    self._condition.wait_for(lambda: self._urgent or self._closed.is_set(), self.sync_interval)
+            self._sync()
+
+    def _sync(self):
+        # Запись и fsync идут вне общей блокировки: добавление в журнал их не ждет
+        with self._io_lock:
+            with self._condition:
+                batch, self._buffer = self._buffer, []
+                self._urgent = False
+                sequence = self._written
+                snapshot = None
+                if self._finished >= self.compact_after:
+                    # Снимок согласован с пачкой: в нем ровно записи до sequence
+                    snapshot = [dict(record) for record in self._jobs.values()]
+                    self._finished = 0
+            if batch:
+                try:
+                    self._file.write('\n'.join(batch) + '\n')
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ошибка записи журнала {self.path}: {e}")
+            if snapshot is not None:
+                self._file.close()
+                self._compact(snapshot)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            with self._condition:
+                self._synced = sequence
+                self._condition.notify_all()
+
+    def _compact(self, records):
+        """Переписывает журнал только с незавершенными заданиями"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._fsync_dir()
+        except OSError as e:
+            logger.error(f"Ошибка сжатия журнала {self.path}: {e}")
+
+    def _fsync_dir(self):
+        # Без fsync каталога переименование может не пережить сбой питания
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        with self._condition:
+            self._closed.set()
+            self._condition.notify_all()
+        self._thread.join(5)
+        self._sync()
+        with self._io_lock:
+            self._file.close()
@@ -0,0 +1,108 @@
+import os
+import time
+import gzip
+import shutil
+import atexit
+import logging
+from queue import Queue, Full
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from metrics import LOG_DROPPED_TOTAL
+
+# Не чаще раза в столько секунд в лог пишется число отброшенных записей
+DROPPED_REPORT_INTERVAL = 60
+
+
+def gzip_namer(name):
+    return f"{name}.gz"
+
+
+def gzip_rotator(source, dest):
+    """Сжимает закрытый файл лога при ротации"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def build_file_handler(path, max_bytes, backup_count, when=None):
+    """Файловый обработчик с ротацией по размеру или по времени и сжатием архивов"""
+    if when:
+        handler = TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+    return handler
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Не блокирует рабочий поток: при переполненной очереди запись отбрасывается.
+
+    Отброшенные записи считаются в метрике, а когда очередь освобождается,
+    в лог попадает предупреждение с их числом.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+        self.reported = 0
+        self.reported_at = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            LOG_DROPPED_TOTAL.inc()
+            return
+        if self.dropped > self.reported and time.monotonic() - self.reported_at >= DROPPED_REPORT_INTERVAL:
+            self.report_dropped(record.name)
+
+    def report_dropped(self, name):
+        """Кладет в очередь предупреждение о записях, отброшенных с прошлого отчета"""
+        count = self.dropped - self.reported
+        warning = logging.LogRecord(
+            name, logging.WARNING, __file__, 0,
+            f"Очередь лога переполнена: отброшено записей {count} (всего {self.dropped})", None, None
+        )
+        try:
+            self.queue.put_nowait(self.prepare(warning))
+        except Full:
+            return
+        self.reported += count
+        self.reported_at = time.monotonic()
+
+
+class LogPipeline:
+    """Асинхронная запись логов: логгер кладет записи в ограниченную очередь,
+    фоновый QueueListener передает их обработчикам (файл, консоль, GUI)"""
+
+    def __init__(self, logger, max_queue=10000):
+        self.logger = logger
+        self.queue = Queue(maxsize=max_queue)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.listener = None
+        self.handlers = []
+        atexit.register(self.stop)
+
+    def start(self, handlers):
+        self.stop()
+        self.handlers = list(handlers)
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        if self.queue_handler not in self.logger.handlers:
+            self.logger.addHandler(self.queue_handler)
+
+    def add_handler(self, handler):
+        """Подключает еще один обработчик к фоновому потоку записи"""
+        self.handlers.append(handler)
+        if self.listener:
+            self.listener.handlers = tuple(self.handlers)
+
+    def stop(self):
+        """Дописывает оставшиеся записи и закрывает обработчики"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+            for handler in self.handlers:
+                handler.close()
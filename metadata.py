@@ -0,0 +1,153 @@
+import re
+import logging
+from threading import Lock
+
+logger = logging.getLogger('MusicBot')
+
+UNKNOWN_ARTIST = 'Unknown Artist'
+UNKNOWN_TITLE = 'Unknown Track'
+
+FILENAME_UNSAFE = re.compile(r'[\\/*?:"<>|]')
+# Разделитель "Артист - Название", в том числе с длинным и коротким тире
+DASH = re.compile(r'\s+[-–—]\s+')
+# Пометки видео, не относящиеся к названию: (Official Video), [Lyrics], (HD) и т.п.
+NOISE = re.compile(
+    r'\s*[(\[]\s*(?:official\s*)?(?:music\s*|lyrics?\s*|audio\s*|hd\s*|hq\s*|4k\s*|visuali[sz]er\s*)*'
+    r'(?:video|audio|lyrics?|visuali[sz]er|clip|hd|hq|4k|mv)\s*[)\]]',
+    re.I
+)
+# Приглашенные: в скобках - "(feat X)", "[ft. X]", "(featuring X)"; без скобок только
+# "feat." и "ft." с точкой и не в начале, чтобы "Feat Test" оставался названием
+FEAT = re.compile(
+    r'\s*[(\[]\s*(?:feat\.?|ft\.?|featuring)\s+([^()\[\]]+?)\s*[)\]]'
+    r'|(?<=\S)\s+(?:feat|ft)\.\s*([^()\[\]]+?)\s*(?=[(\[]|\s[-–—]\s|$)',
+    re.I
+)
+# "Название - X Remix" приводится к "Название (X Remix)", чтобы тире не путалось с разделителем артиста
+VERSION_SUFFIX = re.compile(r'\s+[-–—]\s+([^-–—]*\b(?:remix|mix|edit|version|remaster(?:ed)?|live|acoustic|instrumental)\b[^-–—]*)$', re.I)
+# Автоматические каналы YouTube: "Артист - Topic", "АртистVEVO"
+CHANNEL_SUFFIX = re.compile(r'(?:\s+-\s+Topic|VEVO)$')
+# Делятся только списки приглашенных: "Earth, Wind & Fire" в поле артиста остается целым
+FEATURED_SEPARATOR = re.compile(r'\s*(?:,|&)\s*')
+SPACES = re.compile(r'\s{2,}')
+
+# Быстрая проверка: без этих символов и слов регулярные выражения не нужны
+MARKERS = re.compile(r'[(\[]|\bf(?:ea)?t\.?\s|featuring|\s[-–—]\s', re.I)
+
+
+def sanitize_filename(filename):
+    """Очищает имя файла от недопустимых символов"""
+    return FILENAME_UNSAFE.sub('_', filename)
+
+
+def join_artists(artists, featured):
+    """Артисты и приглашенные через запятую, без повторов"""
+    names = list(artists)
+    # Сравниваются имена целиком: "A" не должен теряться из-за "Band"
+    known = {name.casefold() for name in names}
+    for name in featured:
+        if name.casefold() not in known:
+            names.append(name)
+            known.add(name.casefold())
+    return ', '.join(names)
+
+
+def entry_artists(entry):
+    """Артисты из поля artists YouTube Music (строки или словари с name)"""
+    artists = entry.get('artists') or []
+    names = [artist.get('name') if isinstance(artist, dict) else artist for artist in artists]
+    return [name.strip() for name in names if name and name.strip()]
+
+
+def clean_title(title):
+    """Убирает пометки видео и вынимает приглашенных артистов; возвращает (title, featured)"""
+    if not MARKERS.search(title):
+        return title, []
+    featured = []
+    title = VERSION_SUFFIX.sub(r' (\1)', NOISE.sub('', title))
+
+    def take_featured(match):
+        featured.extend(name for name in FEATURED_SEPARATOR.split(match.group(1) or match.group(2)) if name)
+        return ''
+
+    title = FEAT.sub(take_featured, title)
+    return SPACES.sub(' ', title).strip(' -–—'), featured
+
+
+def normalize_entry(entry):
+    """Возвращает (artist, title) записи плейлиста.
+
+    Приоритет у поля artists YouTube Music; без него артист берется из
+    названия "Артист - Название" (по первому тире) или из канала.
+    """
+    title = (entry.get('track') or entry.get('title') or '').strip()
+    artists = entry_artists(entry)
+    if not artists and entry.get('artist'):
+        artists = [entry['artist'].strip()]
+
+    featured = []
+    if not artists:
+        # Делим по первому тире до чистки: пометки версии тоже пишутся через тире
+        parts = DASH.split(title, 1)
+        if len(parts) == 2 and parts[0] and parts[1]:
+            artist_part, title = parts
+            artist_part, featured = clean_title(artist_part)
+            artists = [artist_part]
+        elif uploader := (entry.get('uploader') or entry.get('channel') or '').strip():
+            artists = [CHANNEL_SUFFIX.sub('', uploader).strip()]
+
+    title, more = clean_title(title)
+    featured += more
+    if artists:
+        # Название на YouTube Music иногда дублирует артиста
+        parts = DASH.split(title, 1)
+        if len(parts) == 2 and parts[0].casefold() in {name.casefold() for name in artists}:
+            title = parts[1]
+
+    artist = join_artists(artists, featured) if artists else UNKNOWN_ARTIST
+    return artist, title or UNKNOWN_TITLE
+
+
+class MetadataNormalizer:
+    """Нормализация с памятью по ID видео.
+
+    Результат переиспользуется, пока не изменились исходные поля записи,
+    поэтому повторные обновления больших плейлистов почти ничего не стоят.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._memo = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def signature(entry):
+        artists = entry.get('artists')
+        return (
+            entry.get('track') or entry.get('title'),
+            entry.get('artist'),
+            entry.get('uploader') or entry.get('channel'),
+            tuple(entry_artists(entry)) if artists else None
+        )
+
+    def normalize(self, entry):
+        video_id = entry.get('id')
+        if not video_id:
+            return normalize_entry(entry)
+        signature = self.signature(entry)
+        with self._lock:
+            memo = self._memo.get(video_id)
+        if memo and memo[0] == signature:
+            return memo[1]
+
+        result = normalize_entry(entry)
+        with self._lock:
+            if len(self._memo) >= self.max_entries:
+                # Словарь хранит порядок вставки: выбрасываем самые старые записи
+                for key in list(self._memo)[:self.max_entries // 10 or 1]:
+                    del self._memo[key]
+            self._memo[video_id] = (signature, result)
+        return result
+
+
+normalizer = MetadataNormalizer()
@@ -0,0 +1,216 @@
+import time
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+
+logger = logging.getLogger('MusicBot')
+
+# Границы корзин гистограмм
+SECONDS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = tuple(1024 * 1024 * mb for mb in (0.5, 1, 2, 5, 10, 20, 50))
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Счетчик с метками; значения хранятся по кортежу меток"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        for labels, value in self.samples():
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами.
+
+    observe() - поиск корзины бисекцией и три сложения под блокировкой,
+    накопительные суммы считаются только при выводе.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [счетчики по корзинам + корзина +Inf, сумма, количество]
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            return sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self._series.items())
+
+    def quantile(self, q, *labels):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        with self._lock:
+            series = self._series.get(labels)
+            if not series or not series[2]:
+                return None
+            rank = q * series[2]
+            seen = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), series[0]):
+                seen += bucket_count
+                if seen >= rank:
+                    return bound
+        return None
+
+    def render(self):
+        for labels, (counts, total, count) in self.samples():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'musicbot_stage_seconds',
+    'Длительность этапов: extract, download, transcode (входит в download), upload, sleep, rate_limit',
+    ('stage',)
+)
+DOWNLOAD_BYTES = REGISTRY.histogram('musicbot_download_bytes', 'Размер скачанного аудио', buckets=BYTES_BUCKETS)
+UPLOAD_BYTES = REGISTRY.histogram('musicbot_upload_bytes', 'Размер загруженного в Telegram аудио', buckets=BYTES_BUCKETS)
+DOWNLOAD_RETRIES = REGISTRY.histogram('musicbot_download_retries', 'Повторов на одно скачивание', buckets=COUNT_BUCKETS)
+TRACKS_TOTAL = REGISTRY.counter('musicbot_tracks_total', 'Отправки треков по результату', ('result',))
+FAILURES_TOTAL = REGISTRY.counter('musicbot_failures_total', 'Ошибки по классам', ('class',))
+CACHE_TOTAL = REGISTRY.counter('musicbot_cache_requests_total', 'Обращения к кэшам', ('cache', 'result'))
+ENCODE_TOTAL = REGISTRY.counter('musicbot_encode_total', 'Выбранные профили кодирования', ('profile',))
+ENCODE_SECONDS = REGISTRY.histogram('musicbot_encode_seconds', 'Время ffmpeg по профилю кодирования', ('profile',))
+ENCODE_BYTES = REGISTRY.histogram('musicbot_encode_bytes', 'Размер результата по профилю кодирования', ('profile',), buckets=BYTES_BUCKETS)
+ENCODE_SAVED_BYTES = REGISTRY.counter('musicbot_encode_saved_bytes_total', 'Экономия размера относительно кодирования с битрейтом по умолчанию')
+RETRIES_TOTAL = REGISTRY.counter('musicbot_retry_errors_total', 'Ошибки обращений по точке и классу', ('endpoint', 'kind'))
+LOG_DROPPED_TOTAL = REGISTRY.counter('musicbot_log_dropped_total', 'Записи лога, отброшенные при переполненной очереди')
+
+
+def summary(registry=REGISTRY):
+    """Краткая сводка для GUI: этапы с p50/p95 и значения счетчиков"""
+    lines = []
+    for metric in registry.metrics:
+        if isinstance(metric, Histogram):
+            for labels, (_, total, count) in metric.samples():
+                name = f"{metric.name}{format_labels(metric.labelnames, labels)}"
+                lines.append(
+                    f"{name}: n={count} avg={total / count:.3g} "
+                    f"p50<={metric.quantile(0.5, *labels)} p95<={metric.quantile(0.95, *labels)}"
+                )
+        else:
+            for labels, value in metric.samples():
+                lines.append(f"{metric.name}{format_labels(metric.labelnames, labels)}: {value}")
+    return '\n'.join(lines)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опросы Prometheus не засоряют лог бота
+        pass
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер с /metrics в фоновом потоке"""
+
+    def __init__(self, host, port, registry=REGISTRY):
+        handler = type('Handler', (MetricsHandler,), {'registry': registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Метрики доступны на http://{self._server.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,1217 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from threading import local
+from contextlib import ExitStack
+import requests
+from telebot.types import InputMediaAudio
+from playlist_cache import PlaylistCache
+from audio_cache import AudioCache
+from file_id_cache import FileIdCache
+from ydl_pool import YDLPool, set_outtmpl, set_audio_format
+from telegram_client import get_client
+from dead_tracks import DeadTrackList, classify_failure
+from stream_transcode import StreamTranscoder, StreamTranscodeError, can_stream, transcode_file
+from chunked_download import ChunkedDownloader, ChunkedDownloadError, BandwidthLimiter
+from log_pipeline import LogPipeline, build_file_handler
+from track_selector import TrackSelector
+from state_store import StateStore
+from job_journal import JobJournal, SELECTED, DOWNLOADED, UPLOADED, CONFIRMED, DROPPED
+from retry import PERMANENT, TELEGRAM_API_ERRORS, RetryLater, get_policy
+from encoding import choose_profile, estimate_bytes, split_audio
+from metrics import STAGE_SECONDS, DOWNLOAD_BYTES, UPLOAD_BYTES, DOWNLOAD_RETRIES, FAILURES_TOTAL, CACHE_TOTAL, MetricsServer
+from metadata import normalizer, sanitize_filename
+from thumbnails import ThumbnailCache, embed_cover
+from temp_storage import TempStorage
+from metrics import ENCODE_TOTAL, ENCODE_SECONDS, ENCODE_BYTES, ENCODE_SAVED_BYTES
+
+# Конфигурация по умолчанию
+DEFAULT_CONFIG = {
+    'telegram_token': '',  # Формат: "123456789:ABCdefGHIjklMnOpQRSTuvwxyz"
+    'telegram_channel': '',
+    'temp_folder': 'temp_audio',
+    # У каждой загрузки свой каталог в temp_folder; сироты удаляются в фоне
+    'temp_max_mb': 1024,  # Лимит временных файлов, сверх него вытесняются свободные каталоги; 0 - без лимита
+    'temp_gc_interval': 600,  # Период фоновой очистки в секундах, 0 - только при запуске
+    'check_interval': 60,  # 1 минута для теста
+    'prefetch_depth': 2,  # Сколько треков держать скачанными заранее
+    'music_source': 'youtube',
+    'youtube_url': 'https://music.youtube.com/playlist?list=PLFTLA_vr_gYaJLKBRIiiBqgJ25TLjUcbF',
+    'max_retries': 3,
+    'request_timeout': 30,
+    # Повторы после ошибок: экспоненциальная пауза с джиттером и предохранитель
+    'retry_base_delay': 5,  # Первая пауза в секундах, дальше удваивается
+    'retry_max_delay': 600,  # Предел паузы
+    'retry_inline_max': 10,  # Паузы дольше не ждут в потоке, задание откладывается
+    'breaker_threshold': 5,  # Ошибок подряд до приостановки запросов к YouTube или каналу
+    'breaker_reset': 300,  # На сколько секунд приостанавливаются запросы
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'use_cookies': True,
+    'cookies_file': 'cookies.txt',
+    'state_db': 'music_bot.db',  # SQLite с кэшами, историей и списком недоступных треков
+    # Журнал отправок: после перезапуска готовые треки досылаются без повторной работы
+    'job_journal': 'music_bot.journal',
+    'journal_compact_after': 500,  # Завершенных отправок до сжатия журнала
+    'playlist_cache_ttl': 3600,  # Время жизни снимка плейлиста в секундах
+    'audio_cache_folder': 'audio_cache',
+    'audio_cache_max_mb': 2048,
+    # Обложки скачиваются параллельно с аудио и хранятся по ID видео
+    'thumbnail_workers': 4,
+    'embed_cover': True,  # Встраивать обложку в mp3 (ID3) перед кэшированием
+    # Задания планировщика: [{'playlist': url, 'channel': '@id', 'interval': секунды}]
+    'jobs': [],
+    'download_workers': 4,
+    'upload_workers': 2,
+    'channel_min_interval': 3,  # Минимум секунд между сообщениями в один канал
+    'global_max_per_second': 25,  # Общий лимит сообщений бота в секунду
+    'telegram_pool_size': 10,  # Размер пула keep-alive соединений к Bot API
+    'telegram_retries': 2,  # Повторы запроса при сетевых ошибках
+    'telegram_async_uploads': False,  # Отправка через asyncio вместо пула потоков
+    'batch_size': 1,  # Треков в одном сообщении-альбоме (sendMediaGroup, до 10), 1 - по одному
+    # Срок исключения недоступных треков по классу ошибки, в секундах
+    'dead_track_ttl': {
+        'unavailable': 7 * 24 * 3600,
+        'age_gated': 24 * 3600,
+        'region_blocked': 3 * 24 * 3600
+    },
+    # Потоковая загрузка: байты идут сразу в ffmpeg без промежуточного webm
+    'stream_transcode': False,
+    # Профиль кодирования выбирается по длительности трека под лимит Bot API
+    'encode_bitrate': 192,  # Обычный битрейт, кбит/с
+    'encode_min_bitrate': 64,  # Ниже этого битрейт ради размера не снижается
+    'upload_max_mb': 49,  # Потолок размера файла (лимит Bot API - 50 МБ)
+    'split_long_tracks': False,  # Резать непомещающиеся треки на части вместо снижения качества
+    'stream_codec': 'mp3',  # mp3 или m4a; совпадающий кодек источника копируется
+    'stream_buffer_chunks': 32,  # Размер буфера в памяти, по 256 КБ
+    # Параллельная загрузка диапазонами байтов с докачкой после перезапуска
+    'chunked_download': False,
+    'download_connections': 4,
+    'download_chunk_mb': 1,
+    'download_bandwidth_kbps': 0,  # Общий лимит скорости всех загрузок, 0 - без лимита
+    # Выбор треков
+    'no_repeat_window': 50,  # Столько последних треков канала не повторяются
+    'selection_lookahead': 8,  # Кандидатов на выбор за один шаг
+    'recency_hours': 0,  # Вес недавно звучавших треков растет до полного за столько часов
+    'min_duration': 0,  # Ограничения длительности в секундах, 0 - без ограничения
+    'max_duration': 0,
+    'artist_spread': 3,  # Реже брать артистов из стольких последних треков
+    'cached_weight': 3.0,  # Во сколько раз чаще брать уже скачанные треки
+    'log_file': 'music_bot.log',
+    'log_max_bytes': 5 * 1024 * 1024,  # Ротация по размеру...
+    'log_rotate_when': '',  # ...или по времени ('midnight', 'H' и т.д.)
+    'log_backup_count': 5,  # Архивы сжимаются в .gz
+    'log_queue_size': 10000,  # При переполнении записи отбрасываются, а не блокируют поток
+    'gui_log_lines': 2000,  # Сколько строк лога хранит окно GUI
+    # Метрики в формате Prometheus на http://metrics_host:metrics_port/metrics, 0 - выключены
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 0
+}
+
+# Глобальные переменные
+CONFIG = DEFAULT_CONFIG.copy()
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Префикс переменных окружения с настройками (MUSICBOT_TELEGRAM_TOKEN и т.д.)
+ENV_PREFIX = 'MUSICBOT_'
+
+# Форматы, которые sendAudio принимает как аудио (opus Telegram отклоняет)
+SEND_AUDIO_CODECS = ('mp3', 'm4a')
+
+def load_config(path=None):
+    """Загружает настройки из JSON-файла и переменных окружения"""
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            CONFIG.update(json.load(f))
+
+    for key, default in DEFAULT_CONFIG.items():
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            value = value.lower() in ('1', 'true', 'yes', 'on')
+        elif isinstance(default, (int, float)):
+            value = type(default)(value)
+        elif isinstance(default, (list, dict)):
+            value = json.loads(value)
+        CONFIG[key] = value
+
+    return CONFIG
+
+log_pipeline = None
+
+def setup_logger():
+    """Настраивает асинхронную запись логов; повторный вызов применяет новые настройки файла"""
+    global log_pipeline
+    logger = logging.getLogger('MusicBot')
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter(LOG_FORMAT)
+    
+    file_handler = build_file_handler(
+        CONFIG['log_file'],
+        CONFIG['log_max_bytes'],
+        CONFIG['log_backup_count'],
+        CONFIG['log_rotate_when']
+    )
+    file_handler.setFormatter(formatter)
+
+    if log_pipeline is None:
+        log_pipeline = LogPipeline(logger, CONFIG['log_queue_size'])
+    # Консоль и GUI сохраняются, файловый обработчик заменяется
+    other_handlers = [h for h in log_pipeline.handlers if not isinstance(h, logging.FileHandler)]
+    log_pipeline.start([file_handler, *other_handlers])
+    
+    return logger
+
+def add_log_handler(handler):
+    """Подключает обработчик к фоновому потоку записи логов"""
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_pipeline.add_handler(handler)
+
+logger = setup_logger()
+
+# Общий пул экземпляров yt-dlp для извлечения плейлистов и загрузки
+ydl_pool = YDLPool()
+
+# Лимит скорости, общий для всех одновременных загрузок
+bandwidth_limiter = BandwidthLimiter()
+
+state_store = None
+
+def get_state_store():
+    """Возвращает хранилище состояния для текущих настроек"""
+    global state_store
+    if state_store is None or state_store.path != CONFIG['state_db']:
+        if state_store is not None:
+            state_store.close()
+        state_store = StateStore(CONFIG['state_db'])
+    return state_store
+
+job_journal = None
+
+def get_job_journal():
+    """Возвращает журнал отправок для текущих настроек"""
+    global job_journal
+    if job_journal is None or job_journal.path != CONFIG['job_journal']:
+        if job_journal is not None:
+            job_journal.close()
+        job_journal = JobJournal(CONFIG['job_journal'], compact_after=CONFIG['journal_compact_after'])
+    job_journal.compact_after = CONFIG['journal_compact_after']
+    return job_journal
+
+temp_storage = None
+
+def get_temp_storage():
+    """Возвращает менеджер временных файлов для текущих настроек"""
+    global temp_storage
+    if temp_storage is None or temp_storage.root != os.path.abspath(CONFIG['temp_folder']):
+        if temp_storage is not None:
+            temp_storage.close()
+        # Файлы незавершенных отправок нужны журналу после перезапуска
+        temp_storage = TempStorage(CONFIG['temp_folder'], keep=lambda: get_job_journal().artifacts())
+        temp_storage.start(CONFIG['temp_gc_interval'])
+    temp_storage.max_bytes = CONFIG['temp_max_mb'] * 1024 * 1024
+    return temp_storage
+
+# Профиль и начало текущего этапа постобработки в потоке загрузки
+_encoding_state = local()
+
+def time_postprocessor(status):
+    """Хук yt-dlp: время работы ffmpeg-постпроцессоров"""
+    if status['status'] == 'started':
+        _encoding_state.started = time.perf_counter()
+    elif status['status'] == 'finished' and getattr(_encoding_state, 'started', None) is not None:
+        elapsed = time.perf_counter() - _encoding_state.started
+        STAGE_SECONDS.observe(elapsed, 'transcode')
+        if profile := getattr(_encoding_state, 'profile', None):
+            ENCODE_SECONDS.observe(elapsed, profile.name)
+        _encoding_state.started = None
+
+def start_metrics_server():
+    """Поднимает /metrics, если в настройках задан порт"""
+    if not CONFIG['metrics_port']:
+        return None
+    try:
+        server = MetricsServer(CONFIG['metrics_host'], CONFIG['metrics_port'])
+        server.start()
+        return server
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик: {e}")
+        return None
+
+def get_retry_policy(endpoint):
+    """Политика повторов точки (youtube, telegram:<канал>) для текущих настроек"""
+    return get_policy(endpoint, **retry_settings())
+
+def retry_settings():
+    return {
+        'base_delay': CONFIG['retry_base_delay'],
+        'max_delay': CONFIG['retry_max_delay'],
+        'threshold': CONFIG['breaker_threshold'],
+        'reset_timeout': CONFIG['breaker_reset'],
+        'inline_max': CONFIG['retry_inline_max']
+    }
+
+def validate_telegram_token(token):
+    """Проверяет правильность формата Telegram токена"""
+    if not token or ':' not in token:
+        logger.error(f"Неверный формат токена: {token}")
+        return False
+    return True
+
+def cleanup_temp_files():
+    """Удаляет временные файлы, кроме свежих недокачанных и нужных журналу отправок"""
+    storage = get_temp_storage()
+    storage.collect()
+    storage.enforce_quota()
+
+def unpin_track(track_data):
+    """Снимает закрепление записи аудиокэша, взятое при подготовке трека.
+
+    Файлы остаются в кэше; незавершенная отправка закрепит их снова при досылке.
+    """
+    if track_data.pop('pinned', False):
+        TrackDownloader.get_cache().release(track_data.get('id'))
+
+def remove_track_files(track_data):
+    """Удаляет файлы скачанного трека"""
+    if track_data.get('cached'):
+        # Файлы из аудиокэша живут дольше одной отправки
+        unpin_track(track_data)
+        return
+    try:
+        if track_data.get('audio_path') and os.path.exists(track_data['audio_path']):
+            os.remove(track_data['audio_path'])
+        if track_data.get('thumb_path') and os.path.exists(track_data['thumb_path']):
+            os.remove(track_data['thumb_path'])
+        # Вместе с файлами освобождается каталог задания
+        get_temp_storage().release(track_data.get('audio_path'))
+    except Exception as e:
+        logger.error(f"Ошибка удаления временных файлов: {e}")
+
+class YouTubeMusicParser:
+    _cache = None
+
+    @staticmethod
+    def get_cache():
+        """Возвращает кэш снимков плейлистов для текущих настроек"""
+        cache = YouTubeMusicParser._cache
+        store = get_state_store()
+        if cache is None or cache.store is not store:
+            cache = PlaylistCache(store, CONFIG['playlist_cache_ttl'])
+            YouTubeMusicParser._cache = cache
+        cache.ttl = CONFIG['playlist_cache_ttl']
+        return cache
+
+    @staticmethod
+    def parse_entry(entry):
+        """Извлекает артиста и название из записи плейлиста"""
+        artist, title = normalizer.normalize(entry)
+        return {
+            'id': entry.get('id'),
+            'artist': artist,
+            'title': title,
+            'duration': entry.get('duration', 0),
+            'url': entry.get('url', ''),
+            # Самая крупная миниатюра из плоского списка плейлиста
+            'thumbnail': (entry.get('thumbnails') or [{}])[-1].get('url')
+        }
+
+    @staticmethod
+    def get_tracks_from_url(url):
+        """Получает треки из YouTube Music плейлиста"""
+        if not url:
+            logger.error("URL YouTube Music не указан")
+            return None
+
+        cache = YouTubeMusicParser.get_cache()
+        if (tracks := cache.get(url)) is not None:
+            logger.info(f"Найдено {len(tracks)} треков в кэше плейлиста")
+            return tracks
+
+        ydl_opts = {
+            'extract_flat': True,
+            'quiet': True,
+            'logger': logger,
+            'extractor_args': {
+                'youtube': {
+                    'skip': ['authcheck'],
+                    'music': True
+                }
+            }
+        }
+        
+        if CONFIG['use_cookies'] and os.path.exists(CONFIG['cookies_file']):
+            ydl_opts['cookiefile'] = CONFIG['cookies_file']
+        
+        policy = get_retry_policy('youtube')
+        try:
+            policy.check()
+            started = time.monotonic()
+            with ydl_pool.acquire('extract', ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+                if not info:
+                    logger.error("Не удалось получить информацию о треках")
+                    return None
+                
+                entries = info.get('entries', [])
+                if not entries:
+                    logger.warning("Плейлист YouTube Music пуст")
+                    return None
+
+            policy.success()
+            tracks, added, removed = cache.update(url, entries, YouTubeMusicParser.parse_entry)
+            STAGE_SECONDS.observe(time.monotonic() - started, 'extract')
+            logger.info(
+                f"Снимок плейлиста обновлен за {time.monotonic() - started:.2f} с: "
+                f"добавлено {len(added)}, удалено {len(removed)}"
+            )
+            logger.info(f"Найдено {len(tracks)} треков из YouTube Music")
+            return tracks
+                
+        except Exception as e:
+            policy.failure(e, 0)
+            FAILURES_TOTAL.inc('extract')
+            logger.error(f"Ошибка получения треков с YouTube Music: {e}")
+            if tracks := cache.stale_tracks(url):
+                logger.warning("Используем устаревший снимок плейлиста")
+                return tracks
+            return None
+
+class TrackDownloader:
+    _cache = None
+    _dead_tracks = None
+    _thumbnails = None
+
+    @staticmethod
+    def get_dead_tracks():
+        """Возвращает список недоступных треков для текущих настроек"""
+        dead_tracks = TrackDownloader._dead_tracks
+        store = get_state_store()
+        if dead_tracks is None or dead_tracks.store is not store:
+            dead_tracks = DeadTrackList(store, CONFIG['dead_track_ttl'])
+            TrackDownloader._dead_tracks = dead_tracks
+        dead_tracks.ttls = CONFIG['dead_track_ttl']
+        return dead_tracks
+
+    @staticmethod
+    def get_cache():
+        """Возвращает аудиокэш для текущих настроек"""
+        cache = TrackDownloader._cache
+        store = get_state_store()
+        if cache is None or cache.folder != CONFIG['audio_cache_folder'] or cache.store is not store:
+            cache = AudioCache(CONFIG['audio_cache_folder'], CONFIG['audio_cache_max_mb'] * 1024 * 1024, store)
+            TrackDownloader._cache = cache
+        cache.max_bytes = CONFIG['audio_cache_max_mb'] * 1024 * 1024
+        return cache
+
+    @staticmethod
+    def get_thumbnails():
+        """Возвращает кэш обложек для текущих настроек"""
+        thumbnails = TrackDownloader._thumbnails
+        folder = os.path.join(CONFIG['audio_cache_folder'], 'thumbs')
+        if thumbnails is None or thumbnails.folder != folder:
+            thumbnails = ThumbnailCache(folder, CONFIG['thumbnail_workers'], CONFIG['request_timeout'])
+            TrackDownloader._thumbnails = thumbnails
+        return thumbnails
+
+    @staticmethod
+    def thumbnail_url(track, info=None):
+        """Ссылка на обложку: из данных видео, из плейлиста или стандартная по ID"""
+        if info and info.get('thumbnail'):
+            return info['thumbnail']
+        if track.get('thumbnail'):
+            return track['thumbnail']
+        return f"https://i.ytimg.com/vi/{track['id']}/hqdefault.jpg"
+
+    @staticmethod
+    def attach_cover(video_id, audio_path, thumb_future):
+        """Дожидается обложки и встраивает ее в mp3 до помещения в кэш"""
+        try:
+            thumb_path = thumb_future.result(timeout=CONFIG['request_timeout'])
+        except Exception as e:
+            logger.warning(f"Обложка {video_id} не готова: {e}")
+            return None
+        if thumb_path and CONFIG['embed_cover']:
+            embed_cover(audio_path, thumb_path)
+        return thumb_path
+
+    @staticmethod
+    def get_ydl_opts():
+        """Возвращает параметры для yt-dlp"""
+        ydl_opts = {
+            # AAC в m4a Bot API принимает как есть: его можно отправить без перекодирования
+            'format': 'bestaudio[ext=m4a]/bestaudio/best',
+            'postprocessors': [
+                {
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': 'mp3',
+                    # Битрейт каждого трека задает профиль кодирования
+                    'preferredquality': str(CONFIG['encode_bitrate']),
+                },
+                {
+                    'key': 'FFmpegMetadata',
+                    'add_metadata': True,
+                }
+            ],
+            # Обложки готовит ThumbnailCache параллельно со скачиванием
+            'writethumbnail': False,
+            'postprocessor_hooks': [time_postprocessor],
+            # Ошибки должны доходить до download(), чтобы отличать недоступные видео
+            'ignoreerrors': False,
+            'extractaudio': True,
+            'logger': logger,
+            'quiet': True,
+            'extractor_args': {
+                'youtube': {
+                    'skip': ['authcheck'],
+                    'music': True
+                }
+            }
+        }
+        
+        if CONFIG['use_cookies'] and os.path.exists(CONFIG['cookies_file']):
+            ydl_opts['cookiefile'] = CONFIG['cookies_file']
+        
+        return ydl_opts
+
+    @staticmethod
+    def get_stream_opts():
+        """Параметры yt-dlp для получения прямой ссылки на аудиопоток"""
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'logger': logger,
+            'quiet': True,
+            'extractor_args': {
+                'youtube': {
+                    'skip': ['authcheck'],
+                    'music': True
+                }
+            }
+        }
+
+        if CONFIG['use_cookies'] and os.path.exists(CONFIG['cookies_file']):
+            ydl_opts['cookiefile'] = CONFIG['cookies_file']
+
+        return ydl_opts
+
+    @staticmethod
+    def get_limiter():
+        """Общий лимит скорости загрузок для текущих настроек"""
+        bandwidth_limiter.rate = CONFIG['download_bandwidth_kbps'] * 1024
+        return bandwidth_limiter
+
+    @staticmethod
+    def stream_codec():
+        """Кодек загрузки диапазонами и потоком из stream_codec; неподходящий для sendAudio заменяется на m4a"""
+        codec = CONFIG['stream_codec']
+        if codec not in SEND_AUDIO_CODECS:
+            logger.warning(f"stream_codec {codec} не принимается sendAudio, используем m4a")
+            return 'm4a'
+        return codec
+
+    @staticmethod
+    def encoding_profile(track, codec, info=None, copy_codec=None):
+        """Профиль кодирования трека под лимит размера загрузки.
+
+        copy_codec берется вместо codec, только если источник в нем
+        копируется целиком без перекодирования.
+        """
+        info = info or {}
+
+        def choose(codec):
+            return choose_profile(
+                track.get('duration') or info.get('duration') or 0,
+                codec,
+                CONFIG['encode_bitrate'],
+                CONFIG['upload_max_mb'] * 1024 * 1024,
+                min_bitrate=CONFIG['encode_min_bitrate'],
+                split=CONFIG['split_long_tracks'],
+                acodec=info.get('acodec'),
+                source_bytes=info.get('filesize') or info.get('filesize_approx'),
+                source_bitrate=info.get('abr')
+            )
+
+        profile = choose(copy_codec) if copy_codec else None
+        if profile is None or profile.name != 'copy':
+            profile = choose(codec)
+        ENCODE_TOTAL.inc(profile.name)
+        bitrate = f", {profile.bitrate} кбит/с" if not profile.copy_audio else ""
+        logger.info(f"Профиль кодирования: {profile.name} ({profile.codec}{bitrate})")
+        return profile
+
+    @staticmethod
+    def record_encoding(profile, audio_path, duration):
+        """Метрики результата: размер и экономия против обычного битрейта"""
+        size = os.path.getsize(audio_path)
+        ENCODE_BYTES.observe(size, profile.name)
+        if duration and (saved := estimate_bytes(duration, CONFIG['encode_bitrate']) - size) > 0:
+            ENCODE_SAVED_BYTES.inc(amount=int(saved))
+
+    @staticmethod
+    def chunked_download(track, out_base):
+        """Скачивает трек параллельными диапазонами; None - нужен обычный режим"""
+        with ydl_pool.acquire('stream', TrackDownloader.get_stream_opts()) as ydl:
+            info = ydl.extract_info(track['url'], download=False)
+
+        if not can_stream(info):
+            logger.warning("Формат нельзя скачать диапазонами, используем yt-dlp")
+            return None
+
+        source_path = f"{out_base}.source.{info.get('ext', 'webm')}"
+        downloader = ChunkedDownloader(
+            connections=CONFIG['download_connections'],
+            chunk_size=CONFIG['download_chunk_mb'] * 1024 * 1024,
+            limiter=TrackDownloader.get_limiter(),
+            timeout=CONFIG['request_timeout']
+        )
+        try:
+            started = time.monotonic()
+            downloader.download(info['url'], source_path, info.get('http_headers'), info.get('filesize'))
+            logger.info(f"Скачано диапазонами за {time.monotonic() - started:.1f} с: {os.path.basename(source_path)}")
+            profile = TrackDownloader.encoding_profile(track, TrackDownloader.stream_codec(), info)
+            with STAGE_SECONDS.time('transcode'), ENCODE_SECONDS.time(profile.name):
+                audio_path = transcode_file(
+                    source_path,
+                    info.get('acodec'),
+                    out_base,
+                    codec=profile.codec,
+                    bitrate=profile.bitrate,
+                    metadata={'title': track.get('title'), 'artist': track.get('artist')},
+                    copy_audio=profile.copy_audio
+                )
+        except (ChunkedDownloadError, StreamTranscodeError, requests.RequestException) as e:
+            # Недокачанный .part остается для докачки при следующей попытке
+            logger.warning(f"Загрузка диапазонами не удалась, используем yt-dlp: {e}")
+            return None
+        finally:
+            downloader.close()
+            if os.path.exists(source_path):
+                os.remove(source_path)
+
+        return {
+            'audio': audio_path,
+            'thumbnail': info.get('thumbnail'),
+            'profile': profile
+        }
+
+    @staticmethod
+    def stream_download(track, out_base):
+        """Скачивает трек потоком через ffmpeg; None - нужен обычный режим"""
+        with ydl_pool.acquire('stream', TrackDownloader.get_stream_opts()) as ydl:
+            info = ydl.extract_info(track['url'], download=False)
+
+        transcoder = StreamTranscoder(
+            buffer_chunks=CONFIG['stream_buffer_chunks'],
+            timeout=CONFIG['request_timeout'],
+            limiter=TrackDownloader.get_limiter()
+        )
+        profile = TrackDownloader.encoding_profile(track, TrackDownloader.stream_codec(), info)
+        try:
+            audio_path = transcoder.transcode(
+                info,
+                out_base,
+                codec=profile.codec,
+                bitrate=profile.bitrate,
+                metadata={'title': track.get('title'), 'artist': track.get('artist')},
+                copy_audio=profile.copy_audio
+            )
+        except StreamTranscodeError as e:
+            logger.warning(f"Потоковая загрузка не удалась, используем временный файл: {e}")
+            return None
+
+        return {
+            'audio': audio_path,
+            'thumbnail': info.get('thumbnail'),
+            'profile': profile
+        }
+
+    @staticmethod
+    def download(track):
+        """Скачивает трек; RetryLater - следующую попытку можно делать только после паузы"""
+        video_id = track.get('id')
+        cache = TrackDownloader.get_cache()
+        thumbnails = TrackDownloader.get_thumbnails()
+        if video_id and (cached := cache.get(video_id)):
+            return {
+                'audio_path': cached['audio_path'],
+                # Записи кэша без обложки остались от версий, хранивших ее отдельно
+                'thumb_path': cached['thumb_path'] or thumbnails.get(video_id),
+                'artist': track.get('artist', 'Unknown Artist'),
+                'title': track.get('title', 'Unknown Track'),
+                'url': track.get('url', ''),
+                'duration': track.get('duration', 0),
+                'id': video_id,
+                'cached': True,
+                # Запись кэша закреплена до отправки (unpin_track)
+                'pinned': True
+            }
+
+        started = time.perf_counter()
+        policy = get_retry_policy('youtube')
+        artist = track.get('artist', 'Unknown Artist')
+        title = track.get('title', 'Unknown Track')
+        # Обложка качается и ужимается в своем пуле, пока идет скачивание аудио
+        thumb_future = thumbnails.fetch(video_id, TrackDownloader.thumbnail_url(track)) if video_id else None
+        storage = get_temp_storage()
+        # Каталог задания по ID видео: недокачанный файл переживает повтор и перезапуск
+        workdir = storage.allocate(video_id)
+        query = f"{artist} - {title}"
+        out_base = os.path.join(workdir, sanitize_filename(query))
+        # Файл трека без ID видео не уходит в кэш и живет в каталоге задания до отправки
+        keep_workdir = False
+        try:
+            for attempt in range(CONFIG['max_retries']):
+                try:
+                    policy.check()
+
+                    files = None
+                    if CONFIG['chunked_download'] and track.get('url'):
+                        files = TrackDownloader.chunked_download(track, out_base)
+                    elif CONFIG['stream_transcode'] and track.get('url'):
+                        files = TrackDownloader.stream_download(track, out_base)
+
+                    if files is None:
+                        try:
+                            with ydl_pool.acquire('download', TrackDownloader.get_ydl_opts()) as ydl:
+                                set_outtmpl(ydl, f"{out_base}.%(ext)s")
+                                # Формат выбирается до скачивания: профиль зависит от кодека источника
+                                info = ydl.extract_info(track.get('url') or f"ytsearch1:{query}", download=False)
+                                if not track.get('url'):
+                                    if not info or not info.get('entries'):
+                                        logger.warning(f"Трек не найден: {query}")
+                                        return None
+                                    info = info['entries'][0]
+                                # AAC, который помещается в лимит, отправляется как есть, остальное - в mp3
+                                profile = TrackDownloader.encoding_profile(track, 'mp3', info, copy_codec='m4a')
+                                _encoding_state.profile = profile
+                                set_audio_format(ydl, profile.codec, profile.bitrate)
+                                ydl.process_ie_result(info, download=True)
+                        finally:
+                            _encoding_state.profile = None
+
+                        # FFmpegExtractAudio пишет файл кодека профиля рядом с шаблоном, каталог не сканируется
+                        audio_path = f"{out_base}.{profile.codec}"
+                        files = {
+                            'audio': audio_path if os.path.exists(audio_path) else None,
+                            'thumbnail': info.get('thumbnail'),
+                            'profile': profile
+                        }
+
+                    policy.success()
+                    if files.get('audio'):
+                        STAGE_SECONDS.observe(time.perf_counter() - started, 'download')
+                        DOWNLOAD_BYTES.observe(os.path.getsize(files['audio']))
+                        DOWNLOAD_RETRIES.observe(attempt)
+                        TrackDownloader.record_encoding(files['profile'], files['audio'], track.get('duration'))
+
+                    cached = False
+                    if video_id and files.get('audio'):
+                        if files.get('thumbnail') and thumb_future.done() and not thumb_future.result():
+                            # Ссылка из плейлиста не сработала, пробуем ту, что вернул экстрактор
+                            thumb_future = thumbnails.fetch(video_id, files['thumbnail'])
+                        thumb_path = TrackDownloader.attach_cover(video_id, files['audio'], thumb_future)
+                        # Обложка переходит в запись кэша: учитывается в его размере и вытесняется вместе с аудио
+                        cached_paths = cache.put(video_id, files['audio'], thumb_path)
+                        files = {'audio': cached_paths['audio_path'], 'thumb': cached_paths['thumb_path']}
+                        cached = True
+
+                    keep_workdir = bool(files.get('audio')) and not cached
+                    return {
+                        'audio_path': files.get('audio'),
+                        'thumb_path': files.get('thumb'),
+                        'artist': artist,
+                        'title': title,
+                        'url': track.get('url', ''),
+                        'duration': track.get('duration', 0),
+                        'id': video_id,
+                        'cached': cached,
+                        'pinned': cached
+                    }
+
+                except Exception as e:
+                    if video_id and (failure_class := classify_failure(e)):
+                        # Повторы бесполезны: видео недоступно, исключаем его из выбора
+                        FAILURES_TOTAL.inc(failure_class)
+                        logger.warning(f"Трек недоступен ({failure_class}): {artist} - {title}")
+                        TrackDownloader.get_dead_tracks().add(video_id, failure_class, str(e))
+                        return None
+                    kind, delay = policy.failure(e, attempt)
+                    FAILURES_TOTAL.inc('download')
+                    logger.warning(f"Попытка {attempt + 1} не удалась ({kind}): {e}")
+                    if kind == PERMANENT or delay is None:
+                        # Повтор не поможет
+                        break
+                    if attempt < CONFIG['max_retries'] - 1:
+                        if delay > policy.inline_max:
+                            # Долгую паузу выдерживает вызывающий, поток загрузки не занимаем
+                            logger.info(f"Повтор загрузки отложен на {delay:.0f} с")
+                            raise RetryLater(delay) from e
+                        time.sleep(delay)
+                    continue
+        
+            DOWNLOAD_RETRIES.observe(CONFIG['max_retries'] - 1)
+            return None
+        finally:
+            if not keep_workdir:
+                storage.release(workdir)
+            if thumb_future:
+                # Готовая обложка уже перенесена в аудиокэш; оставшаяся (загрузка не удалась
+                # или обложка опоздала) нигде не учитывается и удаляется
+                thumbnails.discard(video_id)
+
+class TelegramSender:
+    _cache = None
+
+    @staticmethod
+    def get_cache():
+        """Возвращает кэш file_id для текущих настроек"""
+        cache = TelegramSender._cache
+        store = get_state_store()
+        if cache is None or cache.store is not store:
+            cache = FileIdCache(store)
+            TelegramSender._cache = cache
+        return cache
+
+    @staticmethod
+    def bot_id():
+        """ID бота из токена: file_id действительны только для него"""
+        return CONFIG['telegram_token'].split(':', 1)[0]
+
+    @staticmethod
+    def has_file_id(video_id):
+        return bool(video_id) and TelegramSender.get_cache().get(TelegramSender.bot_id(), video_id) is not None
+
+    @staticmethod
+    def remember_file_ids(video_id, sent_message):
+        """Сохраняет file_id загруженного аудио и его обложки"""
+        audio = getattr(sent_message, 'audio', None)
+        if not video_id or not audio:
+            return
+        thumb = getattr(audio, 'thumbnail', None) or getattr(audio, 'thumb', None)
+        TelegramSender.get_cache().put(
+            TelegramSender.bot_id(),
+            video_id,
+            audio.file_id,
+            thumb.file_id if thumb else None
+        )
+
+    @staticmethod
+    def get_client():
+        """Долгоживущий клиент Bot API для текущего токена"""
+        return get_client(
+            CONFIG['telegram_token'],
+            CONFIG['telegram_pool_size'],
+            CONFIG['telegram_retries'],
+            retry_settings()
+        )
+
+    @staticmethod
+    def build_message(track_data):
+        """Формирует подпись к треку"""
+        duration = track_data.get('duration', 0)
+        if isinstance(duration, int):
+            mins, secs = divmod(duration, 60)
+            duration_str = f"{mins}:{secs:02d}"
+        else:
+            duration_str = str(duration)
+
+        return f"""🎧 <b>Случайный трек с YouTube Music</b>
+
+🎵 <b>{track_data['artist']} - {track_data['title']}</b>
+⏳ <i>Длительность:</i> {duration_str}
+🕒 <i>Время отправки:</i> {datetime.now().strftime('%H:%M')}
+🔗 <a href="{track_data.get('url', '')}">Ссылка на YouTube</a>
+
+#музыка #youtubemusic #случайныйтрек""".strip()
+
+    @staticmethod
+    def upload_parts(track_data):
+        """Файлы для загрузки: трек целиком или его части, если он больше лимита"""
+        audio_path = track_data['audio_path']
+        max_bytes = CONFIG['upload_max_mb'] * 1024 * 1024
+        if not CONFIG['split_long_tracks'] or os.path.getsize(audio_path) <= max_bytes:
+            return [audio_path]
+        # Части живут в своем каталоге задания до remove_parts
+        storage = get_temp_storage()
+        workdir = storage.allocate()
+        try:
+            parts = split_audio(audio_path, track_data.get('duration'), max_bytes, workdir)
+        except StreamTranscodeError as e:
+            logger.error(f"Не удалось разрезать трек: {e}")
+            parts = [audio_path]
+        if parts == [audio_path]:
+            storage.release(workdir)
+        return parts
+
+    @staticmethod
+    def remove_parts(parts, track_data):
+        for path in parts:
+            if path != track_data['audio_path']:
+                get_temp_storage().release(path)
+
+    @staticmethod
+    def part_caption(message, index, total):
+        return message if total == 1 else f"{message}\n\n💿 Часть {index + 1} из {total}"
+
+    @staticmethod
+    def is_stale_file_id(error):
+        """Telegram отклонил сохраненный file_id"""
+        return isinstance(error, TELEGRAM_API_ERRORS) and error.error_code == 400
+
+    @staticmethod
+    def send_steps(track_data, chat_id):
+        """Логика отправки трека без сетевого ввода-вывода.
+
+        Генератор отдает вызовы Bot API (метод, параметры) и получает их
+        результат или исключение; итог (успех) - значение StopIteration.
+        Так одна реализация работает и в потоках, и в цикле asyncio.
+        """
+        try:
+            if not track_data:
+                logger.error("Нет данных для отправки")
+                return False
+
+            if not validate_telegram_token(CONFIG['telegram_token']):
+                logger.error("Неверный формат Telegram токена")
+                return False
+
+            message = TelegramSender.build_message(track_data)
+            video_id = track_data.get('id')
+            cache = TelegramSender.get_cache()
+            # Задание в журнале принадлежит исходному треку, даже если файл скачан заново
+            job_data = track_data
+
+            # Повторная отправка по file_id: без загрузки и скачивания.
+            # Обложка при этом берется из исходного сообщения.
+            file_ids = cache.get(TelegramSender.bot_id(), video_id) if video_id else None
+            if video_id:
+                CACHE_TOTAL.inc('file_id', 'hit' if file_ids else 'miss')
+            if file_ids:
+                try:
+                    with STAGE_SECONDS.time('upload'):
+                        yield 'send_audio', dict(
+                            chat_id=chat_id,
+                            audio=file_ids['audio'],
+                            caption=message,
+                            parse_mode='HTML',
+                            timeout=60
+                        )
+                    mark_uploaded(job_data)
+                    logger.info(f"Успешно отправлен по file_id: {track_data['artist']} - {track_data['title']}")
+                    return True
+                except Exception as e:
+                    if not TelegramSender.is_stale_file_id(e):
+                        FAILURES_TOTAL.inc('telegram')
+                        logger.error(f"Ошибка отправки в Telegram: {e}")
+                        return False
+                    logger.warning(f"Telegram отклонил file_id трека {video_id}: {e}. Загружаем файл заново")
+                    cache.remove(TelegramSender.bot_id(), video_id)
+                    if not track_data.get('audio_path'):
+                        track_data = TrackDownloader.download(track_data) or track_data
+
+            if track_data.get('audio_path'):
+                parts = TelegramSender.upload_parts(track_data)
+                try:
+                    for index, audio_path in enumerate(parts):
+                        with open(audio_path, 'rb') as audio_file:
+                            thumb = None
+                            if track_data.get('thumb_path') and os.path.exists(track_data['thumb_path']):
+                                thumb = open(track_data['thumb_path'], 'rb')
+
+                            try:
+                                with STAGE_SECONDS.time('upload'):
+                                    sent = yield 'send_audio', dict(
+                                        chat_id=chat_id,
+                                        audio=audio_file,
+                                        caption=TelegramSender.part_caption(message, index, len(parts)),
+                                        parse_mode='HTML',
+                                        thumb=thumb,
+                                        timeout=60
+                                    )
+                                UPLOAD_BYTES.observe(os.path.getsize(audio_path))
+                                if len(parts) == 1:
+                                    # file_id частей не сохраняем: трек из них не собрать одним сообщением
+                                    TelegramSender.remember_file_ids(video_id, sent)
+                            except Exception as e:
+                                FAILURES_TOTAL.inc('telegram')
+                                logger.error(f"Ошибка отправки в Telegram: {e}")
+                                return False
+                            finally:
+                                if thumb:
+                                    thumb.close()
+                finally:
+                    TelegramSender.remove_parts(parts, track_data)
+
+                # Файлы трека удаляет finish_job после отметки в журнале
+                mark_uploaded(job_data)
+                logger.info(f"Успешно отправлен: {track_data['artist']} - {track_data['title']}")
+                return True
+            
+            # Если не удалось отправить аудио, отправляем текстовое сообщение
+            try:
+                yield 'send_message', dict(
+                    chat_id=chat_id,
+                    text=message,
+                    parse_mode='HTML'
+                )
+                mark_uploaded(job_data)
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка отправки сообщения: {e}")
+                return False
+        
+        except Exception as e:
+            logger.error(f"Ошибка отправки трека: {e}")
+            return False
+
+    @staticmethod
+    def advance(steps, result=None, error=None):
+        """Шаг send_steps: (следующий вызов Bot API, None) или (None, итог)"""
+        try:
+            return (steps.throw(error) if error else steps.send(result)), None
+        except StopIteration as stop:
+            return None, stop.value
+
+    @staticmethod
+    def send_track(track_data, chat_id=None):
+        """Отправляет трек в Telegram (по умолчанию в канал из настроек)"""
+        steps = TelegramSender.send_steps(track_data, chat_id or CONFIG['telegram_channel'])
+        client = TelegramSender.get_client()
+        request, outcome = TelegramSender.advance(steps)
+        while request:
+            method, kwargs = request
+            try:
+                result, error = client.call(method, **kwargs), None
+            except Exception as e:
+                result, error = None, e
+            request, outcome = TelegramSender.advance(steps, result, error)
+        return outcome
+
+    @staticmethod
+    def can_batch(track_data):
+        """Трек уходит в альбом одним файлом: по file_id или целиком без нарезки"""
+        if TelegramSender.has_file_id(track_data.get('id')):
+            return True
+        audio_path = track_data.get('audio_path')
+        return bool(audio_path) and os.path.exists(audio_path) and (
+            os.path.getsize(audio_path) <= CONFIG['upload_max_mb'] * 1024 * 1024
+        )
+
+    @staticmethod
+    def send_batch(tracks, chat_id=None, fallback=True):
+        """Отправляет до 10 треков одним альбомом (sendMediaGroup).
+
+        Треки, которые нельзя отправить в альбоме, а также весь альбом
+        при ошибке отправляются по одному через send_track. Возвращает
+        список успехов в порядке tracks. С fallback=False неотправленные
+        треки получают False: по одному их отправляет вызывающий, со своим
+        лимитом частоты.
+        """
+        chat_id = chat_id or CONFIG['telegram_channel']
+        send_one = TelegramSender.send_track if fallback else lambda track_data, chat_id: False
+        batch = [index for index, track_data in enumerate(tracks) if TelegramSender.can_batch(track_data)][:10]
+        # В альбоме должно быть хотя бы два элемента
+        if len(batch) < 2:
+            return [send_one(track_data, chat_id=chat_id) for track_data in tracks]
+
+        results = [None] * len(tracks)
+        if TelegramSender.send_media_group([tracks[index] for index in batch], chat_id):
+            for index in batch:
+                results[index] = True
+        else:
+            logger.warning("Альбом не отправлен, отправляем треки по одному")
+        return [
+            result if result is not None else send_one(track_data, chat_id=chat_id)
+            for result, track_data in zip(results, tracks)
+        ]
+
+    @staticmethod
+    def send_media_group(tracks, chat_id):
+        """Один вызов sendMediaGroup с подписью у каждого трека; False - ошибка"""
+        if not validate_telegram_token(CONFIG['telegram_token']):
+            return False
+        cache = TelegramSender.get_cache()
+        bot_id = TelegramSender.bot_id()
+        try:
+            with ExitStack() as files:
+                media = []
+                uploaded_bytes = 0
+                for track_data in tracks:
+                    file_ids = cache.get(bot_id, track_data.get('id')) if track_data.get('id') else None
+                    if track_data.get('id'):
+                        CACHE_TOTAL.inc('file_id', 'hit' if file_ids else 'miss')
+                    if file_ids:
+                        audio = file_ids['audio']
+                        thumb = None
+                    else:
+                        audio = files.enter_context(open(track_data['audio_path'], 'rb'))
+                        uploaded_bytes += os.path.getsize(track_data['audio_path'])
+                        thumb = None
+                        if track_data.get('thumb_path') and os.path.exists(track_data['thumb_path']):
+                            thumb = files.enter_context(open(track_data['thumb_path'], 'rb'))
+                    media.append(InputMediaAudio(
+                        audio,
+                        thumbnail=thumb,
+                        caption=TelegramSender.build_message(track_data),
+                        parse_mode='HTML',
+                        performer=track_data.get('artist'),
+                        title=track_data.get('title')
+                    ))
+
+                with STAGE_SECONDS.time('upload'):
+                    sent = TelegramSender.get_client().call('send_media_group', chat_id=chat_id, media=media, timeout=120)
+        except Exception as e:
+            FAILURES_TOTAL.inc('telegram')
+            logger.error(f"Ошибка отправки альбома в Telegram: {e}")
+            return False
+
+        if uploaded_bytes:
+            UPLOAD_BYTES.observe(uploaded_bytes)
+        for track_data, message in zip(tracks, sent):
+            mark_uploaded(track_data)
+            TelegramSender.remember_file_ids(track_data.get('id'), message)
+        logger.info(f"Успешно отправлен альбом из {len(tracks)} треков")
+        return True
+
+    @staticmethod
+    async def send_track_async(track_data, chat_id=None):
+        """Асинхронный вариант send_track для одновременной отправки в разные каналы.
+
+        Вызовы Bot API ждут в цикле событий, а шаги между ними (открытие и
+        нарезка файлов, повторное скачивание) выполняются в пуле потоков.
+        """
+        loop = asyncio.get_running_loop()
+        steps = TelegramSender.send_steps(track_data, chat_id or CONFIG['telegram_channel'])
+        client = TelegramSender.get_client()
+        request, outcome = await loop.run_in_executor(None, TelegramSender.advance, steps)
+        while request:
+            method, kwargs = request
+            try:
+                result, error = await client.call_async(method, **kwargs), None
+            except Exception as e:
+                result, error = None, e
+            request, outcome = await loop.run_in_executor(None, TelegramSender.advance, steps, result, error)
+        return outcome
+
+track_selector = None
+
+def get_track_selector():
+    """Возвращает движок выбора треков для текущих настроек"""
+    global track_selector
+    store = get_state_store()
+    if track_selector is None or track_selector.history.store is not store:
+        track_selector = TrackSelector(store)
+    track_selector.window = CONFIG['no_repeat_window']
+    track_selector.lookahead = CONFIG['selection_lookahead']
+    track_selector.recency_hours = CONFIG['recency_hours']
+    track_selector.min_duration = CONFIG['min_duration']
+    track_selector.max_duration = CONFIG['max_duration']
+    track_selector.artist_spread = CONFIG['artist_spread']
+    track_selector.cached_weight = CONFIG['cached_weight']
+    return track_selector
+
+def is_track_cached(video_id):
+    """Трек можно отправить без скачивания или он уже лежит в аудиокэше"""
+    return TelegramSender.has_file_id(video_id) or TrackDownloader.get_cache().contains(video_id)
+
+def choose_track(tracks, channel=None, playlist=None):
+    """Выбирает следующий трек плейлиста для канала, пропуская недоступные"""
+    track = get_track_selector().select(
+        tracks,
+        channel or CONFIG['telegram_channel'],
+        playlist or CONFIG['youtube_url'],
+        dead_ids=TrackDownloader.get_dead_tracks().dead_ids(),
+        is_cached=is_track_cached
+    )
+    if not track:
+        logger.warning("Все треки плейлиста временно недоступны")
+    return track
+
+def resume_jobs(channel):
+    """Незавершенные отправки канала из журнала после перезапуска.
+
+    Уже принятые Telegram отправки только закрываются, чтобы не отправить
+    трек дважды. Возвращает задания, которые нужно довести до конца.
+    """
+    journal = get_job_journal()
+    resumable = []
+    for record in journal.pending(channel):
+        if record['state'] == UPLOADED:
+            remove_track_files(record.get('track_data') or {})
+            journal.advance(record['job'], CONFIRMED)
+        else:
+            resumable.append(record)
+    if resumable:
+        logger.info(f"Журнал: незавершенных отправок в {channel}: {len(resumable)}")
+    return resumable
+
+def resume_track(record):
+    """Готовит трек задания из журнала, переиспользуя скачанные файлы"""
+    track_data = record.get('track_data')
+    if record['state'] == DOWNLOADED and track_data and track_data.get('cached'):
+        # Закрепление не переживает перезапуск: запись кэша закрепляется заново,
+        # а вытесненный за это время трек скачивается еще раз
+        if cached := TrackDownloader.get_cache().get(track_data.get('id')):
+            logger.info(f"Журнал: трек в аудиокэше, скачивание пропущено: {track_data['artist']} - {track_data['title']}")
+            return dict(track_data, audio_path=cached['audio_path'], thumb_path=cached['thumb_path'], pinned=True, job_id=record['job'])
+    elif record['state'] == DOWNLOADED and track_data and (
+        not track_data.get('audio_path') or os.path.exists(track_data['audio_path'])
+    ):
+        logger.info(f"Журнал: файлы трека на месте, скачивание пропущено: {track_data['artist']} - {track_data['title']}")
+        return dict(track_data, job_id=record['job'])
+    return journal_prepare(record['track'], record['job'])
+
+def begin_job(track, channel=None):
+    """Записывает в журнал выбор трека для канала"""
+    return get_job_journal().begin(channel or CONFIG['telegram_channel'], track)
+
+def journal_prepare(track, job_id):
+    """prepare_track с записью результата в журнал.
+
+    При RetryLater задание остается выбранным: исключение несет его запись,
+    чтобы вызывающий повторил тот же трек после паузы.
+    """
+    try:
+        track_data = prepare_track(track)
+    except RetryLater as e:
+        e.record = {'job': job_id, 'state': SELECTED, 'track': track}
+        raise
+    if not track_data:
+        get_job_journal().advance(job_id, DROPPED)
+        return None
+    get_job_journal().advance(job_id, DOWNLOADED, track_data)
+    return dict(track_data, job_id=job_id)
+
+def mark_uploaded(track_data):
+    """Отмечает в журнале, что Telegram принял трек.
+
+    Вызывается сразу после ответа Bot API и ждет записи на диск до любых
+    других действий: после сбоя трек не будет отправлен второй раз.
+    """
+    get_job_journal().advance(track_data.get('job_id'), UPLOADED, durable=True)
+    track_data['uploaded'] = True
+
+def finish_job(track_data, success):
+    """Закрывает задание после попытки отправки; после успеха удаляет файлы трека"""
+    journal = get_job_journal()
+    job_id = track_data.get('job_id')
+    if not success:
+        journal.advance(job_id, DROPPED)
+        unpin_track(track_data)
+        return
+    if not track_data.get('uploaded'):
+        mark_uploaded(track_data)
+    # Файлы живут до подтверждения: без отметки uploaded их переиспользует досылка
+    remove_track_files(track_data)
+    journal.advance(job_id, CONFIRMED)
+
+def prepare_track(track):
+    """Готовит трек к отправке: по известному file_id скачивание не нужно"""
+    if TelegramSender.has_file_id(track.get('id')):
+        logger.info(f"Трек уже загружался в Telegram, скачивание пропущено: {track['artist']} - {track['title']}")
+        return dict(track, audio_path=None, thumb_path=None)
+    return TrackDownloader.download(track)
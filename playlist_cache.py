@@ -0,0 +1,107 @@
+import json
+import time
+import logging
+from threading import Lock
+from metrics import CACHE_TOTAL
+
+logger = logging.getLogger('MusicBot')
+
+
+def track_key(track):
+    return track.get('id') or track.get('url')
+
+
+class PlaylistCache:
+    """Снимки плейлистов в хранилище состояния с TTL и инкрементальным обновлением"""
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._snapshots = self._load()
+
+    def _load(self):
+        snapshots = {}
+        try:
+            tracks_by_url = {}
+            for url, video_id, data in self.store.query('SELECT url, video_id, data FROM playlist_tracks'):
+                tracks_by_url.setdefault(url, {})[video_id] = json.loads(data)
+            for url, fetched_at, track_order in self.store.query('SELECT url, fetched_at, track_order FROM playlists'):
+                known = tracks_by_url.get(url, {})
+                tracks = [known[key] for key in json.loads(track_order) if key in known]
+                snapshots[url] = {'fetched_at': fetched_at, 'tracks': tracks}
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша плейлистов: {e}")
+        return snapshots
+
+    def get(self, url):
+        """Возвращает треки из снимка, если он не устарел"""
+        with self._lock:
+            snapshot = self._snapshots.get(url)
+            if snapshot and time.time() - snapshot['fetched_at'] < self.ttl:
+                self.hits += 1
+                CACHE_TOTAL.inc('playlist', 'hit')
+                logger.info(f"Кэш плейлиста: попадание (hits={self.hits}, misses={self.misses})")
+                return snapshot['tracks']
+
+            self.misses += 1
+            CACHE_TOTAL.inc('playlist', 'miss')
+            logger.info(f"Кэш плейлиста: промах (hits={self.hits}, misses={self.misses})")
+            return None
+
+    def stale_tracks(self, url):
+        """Возвращает треки из снимка без учета TTL"""
+        with self._lock:
+            snapshot = self._snapshots.get(url)
+            return snapshot['tracks'] if snapshot else None
+
+    def update(self, url, entries, parse_entry):
+        """Обновляет снимок по свежему списку записей плейлиста.
+
+        Разбираются и записываются только добавленные записи, уже известные
+        треки переиспользуются. Возвращает (tracks, added_ids, removed_ids).
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(url) or {'tracks': []}
+            known = {track_key(track): track for track in snapshot['tracks'] if track_key(track)}
+
+            tracks = []
+            added = []
+            seen = set()
+            for entry in entries:
+                key = entry.get('id') or entry.get('url')
+                if key and key in seen:
+                    continue
+                if key:
+                    seen.add(key)
+                if key in known:
+                    tracks.append(known[key])
+                    continue
+                track = parse_entry(entry)
+                tracks.append(track)
+                if key:
+                    added.append(key)
+
+            removed = [key for key in known if key not in seen]
+            fetched_at = time.time()
+            self._snapshots[url] = {'fetched_at': fetched_at, 'tracks': tracks}
+
+            added_set = set(added)
+            self.store.executemany(
+                'INSERT OR REPLACE INTO playlist_tracks (url, video_id, data) VALUES (?, ?, ?)',
+                [
+                    (url, track_key(track), json.dumps(track, ensure_ascii=False))
+                    for track in tracks if track_key(track) in added_set
+                ]
+            )
+            self.store.executemany(
+                'DELETE FROM playlist_tracks WHERE url = ? AND video_id = ?',
+                [(url, key) for key in removed]
+            )
+            self.store.execute(
+                'INSERT OR REPLACE INTO playlists (url, fetched_at, track_order) VALUES (?, ?, ?)',
+                (url, fetched_at, json.dumps([track_key(track) for track in tracks if track_key(track)]))
+            )
+            return tracks, added, removed
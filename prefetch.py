@@ -0,0 +1,81 @@
+import logging
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from retry import RetryLater
+
+logger = logging.getLogger('MusicBot')
+
+
+class TrackPrefetcher:
+    """Фоновая предзагрузка следующих треков (производитель/потребитель)"""
+
+    def __init__(self, produce, discard, depth, retry_delay=60):
+        # produce() возвращает готовые данные трека или None (RetryLater - повтор после паузы),
+        # discard(track_data) удаляет файлы невостребованного трека,
+        # retry_delay - пауза после неудачи в секундах или функция от числа неудач подряд
+        self.produce = produce
+        self.discard = discard
+        self.depth = max(1, depth)
+        self.retry_delay = retry_delay
+        self._queue = Queue(maxsize=self.depth)
+        self._stop_event = Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        logger.info(f"Предзагрузка запущена (глубина {self.depth})")
+
+    def _worker(self):
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                track_data = self.produce()
+            except RetryLater as e:
+                # Пауза выдерживается здесь, а не в потоке загрузки
+                logger.info(f"Предзагрузка: {e}")
+                self._stop_event.wait(e.delay)
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка предзагрузки трека: {e}")
+                track_data = None
+
+            if not track_data:
+                failures += 1
+                delay = self.retry_delay(failures) if callable(self.retry_delay) else self.retry_delay
+                logger.info(f"Следующая попытка предзагрузки через {delay:.0f} с")
+                self._stop_event.wait(delay)
+                continue
+            failures = 0
+
+            # Ждем свободного места в очереди, не теряя реакцию на остановку
+            while not self._stop_event.is_set():
+                try:
+                    self._queue.put(track_data, timeout=1)
+                    break
+                except Full:
+                    continue
+            else:
+                self.discard(track_data)
+
+    def get(self, timeout=1):
+        """Возвращает готовый трек или None, если за timeout ничего не появилось"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def stop(self, timeout=None):
+        """Останавливает предзагрузку и удаляет невостребованные треки"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        dropped = 0
+        while True:
+            try:
+                self.discard(self._queue.get_nowait())
+                dropped += 1
+            except Empty:
+                break
+        logger.info(f"Предзагрузка остановлена, удалено готовых треков: {dropped}")
@@ -0,0 +1,195 @@
+import re
+import time
+import random
+import logging
+from threading import Lock
+from telebot import apihelper
+from dead_tracks import classify_failure
+from metrics import RETRIES_TOTAL
+
+logger = logging.getLogger('MusicBot')
+
+# Классы ошибок для повторов
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+RATE_LIMITED = 'rate_limited'
+
+TELEGRAM_API_ERRORS = (apihelper.ApiTelegramException,)
+try:
+    # aiohttp нужен только для асинхронной отправки
+    from telebot import asyncio_helper
+    TELEGRAM_API_ERRORS += (asyncio_helper.ApiTelegramException,)
+except ImportError:
+    pass
+
+RATE_LIMIT_PATTERN = re.compile(r"HTTP Error 429|Too Many Requests|confirm you.?re not a bot|rate[- ]?limit", re.I)
+
+_registry_lock = Lock()
+_policies = {}
+
+
+class CircuitOpenError(Exception):
+    """Точка временно закрыта предохранителем или по подсказке сервера"""
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"{endpoint}: запросы приостановлены еще на {retry_after:.0f} с")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class RetryLater(Exception):
+    """Повтор нужен после паузы длиннее inline_max: ее выдерживает вызывающий, не занимая поток"""
+
+    def __init__(self, delay, record=None):
+        super().__init__(f"повтор отложен на {delay:.0f} с")
+        self.delay = delay
+        # Запись журнала, задание которой нужно повторить
+        self.record = record
+
+
+def retry_after_hint(error):
+    """Пауза, которую просит сервер (retry_after Telegram, заголовок Retry-After)"""
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    if isinstance(error, TELEGRAM_API_ERRORS):
+        parameters = (error.result_json or {}).get('parameters') or {}
+        if parameters.get('retry_after'):
+            return float(parameters['retry_after'])
+    # yt-dlp заворачивает исходную ошибку в DownloadError
+    exc_info = getattr(error, 'exc_info', None)
+    if isinstance(exc_info, tuple) and exc_info[1] is not None and exc_info[1] is not error:
+        return retry_after_hint(exc_info[1])
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if value and str(value).isdigit():
+        return float(value)
+    return None
+
+
+def classify_error(error):
+    """Возвращает (класс ошибки, подсказанная сервером пауза или None)"""
+    hint = retry_after_hint(error)
+    if isinstance(error, CircuitOpenError):
+        return RATE_LIMITED, hint
+    if isinstance(error, TELEGRAM_API_ERRORS):
+        if error.error_code == 429:
+            return RATE_LIMITED, hint
+        if 400 <= error.error_code < 500:
+            # Неверный запрос, нет доступа к каналу: повтор не поможет
+            return PERMANENT, None
+        return TRANSIENT, hint
+    if classify_failure(error):
+        return PERMANENT, None
+    if hint is not None or RATE_LIMIT_PATTERN.search(str(error)):
+        return RATE_LIMITED, hint
+    return TRANSIENT, None
+
+
+class Backoff:
+    """Экспоненциальная пауза base * 2^attempt с джиттером, не больше cap"""
+
+    def __init__(self, base=5, cap=600):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt):
+        ceiling = min(self.cap, self.base * 2 ** min(max(attempt, 0), 30))
+        # Половина паузы случайна, чтобы повторы разных заданий не совпадали
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """После threshold ошибок подряд точка закрывается на reset_timeout.
+
+    По истечении срока запросы снова разрешены (полуоткрытое состояние):
+    первая же ошибка закрывает точку повторно, успех сбрасывает счетчик.
+    """
+
+    def __init__(self, endpoint, threshold=5, reset_timeout=300):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._open_until = 0.0
+        self._lock = Lock()
+
+    def wait_time(self):
+        """Сколько секунд точка еще закрыта"""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self._open_until = time.monotonic() + self.reset_timeout
+                logger.warning(
+                    f"{self.endpoint}: {self.failures} ошибок подряд, запросы приостановлены на {self.reset_timeout} с"
+                )
+
+    def hold(self, seconds):
+        """Закрывает точку по подсказке сервера"""
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """Повторы обращений к одной точке: классификация, пауза и предохранитель"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.backoff = Backoff()
+        self.breaker = CircuitBreaker(endpoint)
+        # Паузы длиннее этой вызывающий не ждет сам, а откладывает работу
+        self.inline_max = 10
+
+    def configure(self, base_delay, max_delay, threshold, reset_timeout, inline_max):
+        self.backoff.base = base_delay
+        self.backoff.cap = max_delay
+        self.breaker.threshold = threshold
+        self.breaker.reset_timeout = reset_timeout
+        self.inline_max = inline_max
+
+    def check(self):
+        """Бросает CircuitOpenError, если точка закрыта"""
+        if (wait := self.breaker.wait_time()) > 0:
+            raise CircuitOpenError(self.endpoint, wait)
+
+    def success(self):
+        self.breaker.record_success()
+
+    def failure(self, error, attempt):
+        """Учитывает ошибку и возвращает (класс, пауза перед повтором или None)"""
+        kind, hint = classify_error(error)
+        RETRIES_TOTAL.inc(self.endpoint.split(':', 1)[0], kind)
+        if kind == PERMANENT:
+            # Недоступное видео или канал не говорят о состоянии самой точки
+            return kind, None
+        if isinstance(error, CircuitOpenError):
+            return kind, hint
+        if kind == RATE_LIMITED:
+            delay = hint if hint is not None else self.backoff.delay(attempt)
+            self.breaker.hold(delay)
+            logger.warning(f"{self.endpoint}: ограничение частоты, пауза {delay:.0f} с")
+            return kind, delay
+        self.breaker.record_failure()
+        return kind, self.backoff.delay(attempt)
+
+    def next_delay(self, failures):
+        """Пауза перед следующей попыткой после failures неудач подряд"""
+        return max(self.backoff.delay(failures - 1), self.breaker.wait_time())
+
+
+def get_policy(endpoint, base_delay=5, max_delay=600, threshold=5, reset_timeout=300, inline_max=10):
+    """Возвращает общую политику повторов для точки (youtube, telegram:<канал>)"""
+    with _registry_lock:
+        policy = _policies.get(endpoint)
+        if policy is None:
+            policy = RetryPolicy(endpoint)
+            _policies[endpoint] = policy
+    policy.configure(base_delay, max_delay, threshold, reset_timeout, inline_max)
+    return policy
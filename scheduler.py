@@ -0,0 +1,229 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from threading import Condition, Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait
+from music_bot import (
+    CONFIG,
+    logger,
+    cleanup_temp_files,
+    choose_track,
+    begin_job,
+    journal_prepare,
+    resume_jobs,
+    resume_track,
+    finish_job,
+    unpin_track,
+    get_retry_policy,
+    YouTubeMusicParser,
+    TelegramSender
+)
+from telegram_client import get_async_runner
+from retry import RetryLater
+from metrics import STAGE_SECONDS, TRACKS_TOTAL
+
+
+class RateLimiter:
+    """Лимиты Telegram: пауза между сообщениями в канал и общий лимит в секунду"""
+
+    def __init__(self, channel_interval, global_per_second):
+        self.channel_interval = channel_interval
+        self.global_interval = 1 / global_per_second if global_per_second else 0
+        self._lock = Lock()
+        self._channel_next = {}
+        self._global_next = 0.0
+
+    def reserve(self, channel):
+        """Бронирует слот отправки и возвращает, сколько секунд его ждать"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._channel_next.get(channel, 0.0), self._global_next)
+            self._channel_next[channel] = slot + self.channel_interval
+            self._global_next = slot + self.global_interval
+            return slot - now
+
+    def acquire(self, channel, stop_event=None):
+        delay = self.reserve(channel)
+        STAGE_SECONDS.observe(max(delay, 0), 'rate_limit')
+        if delay > 0:
+            if stop_event:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+class Job:
+    """Задание: плейлист, канал и интервал отправки"""
+
+    def __init__(self, playlist, channel, interval):
+        self.playlist = playlist
+        self.channel = channel
+        self.interval = interval
+        self.next_due = time.monotonic()
+        # Неудач подряд: от них растет пауза перед повтором
+        self.failures = 0
+
+    def __repr__(self):
+        return f"{self.playlist} -> {self.channel} каждые {self.interval} с"
+
+
+class Scheduler:
+    """Планировщик многих заданий с общими пулами загрузки и отправки.
+
+    Задания хранятся в куче по времени следующего запуска. Пока задание
+    выполняется, его нет в куче, поэтому одно задание не запускается дважды.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = [Job(job['playlist'], job['channel'], job['interval']) for job in jobs]
+        self.rate_limiter = RateLimiter(CONFIG['channel_min_interval'], CONFIG['global_max_per_second'])
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+        self._stop_event = Event()
+        self._async_uploads = set()
+        # Незавершенные отправки из журнала по каналам
+        self._resume = {}
+
+    def stop(self):
+        """Просит планировщик завершиться"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _push(self, job):
+        with self._condition:
+            heapq.heappush(self._heap, (job.next_due, next(self._counter), job))
+            self._condition.notify_all()
+
+    def _reschedule(self, job, success):
+        if success:
+            # Расписание считается от плановых моментов, а не от конца работы
+            job.failures = 0
+            job.next_due = max(job.next_due + job.interval, time.monotonic())
+        else:
+            # Повтор ждет в куче, а не в потоке: остальные задания не простаивают
+            job.failures += 1
+            delay = max(
+                get_retry_policy('youtube').next_delay(job.failures),
+                get_retry_policy(f'telegram:{job.channel}').breaker.wait_time()
+            )
+            logger.info(f"[{job.channel}] Повтор через {delay:.0f} с (неудач подряд: {job.failures})")
+            job.next_due = time.monotonic() + delay
+        self._push(job)
+
+    def _download(self, job):
+        resume = self._resume.get(job.channel)
+        while resume:
+            if track_data := resume_track(resume.popleft()):
+                return track_data
+
+        if not (tracks := YouTubeMusicParser.get_tracks_from_url(job.playlist)):
+            logger.warning(f"Не удалось получить треки для {job.channel}")
+            return None
+
+        if not (track := choose_track(tracks, job.channel, job.playlist)):
+            return None
+        logger.info(f"[{job.channel}] Выбран трек: {track['artist']} - {track['title']}")
+        return journal_prepare(track, begin_job(track, job.channel))
+
+    def _upload(self, job, track_data):
+        try:
+            self.rate_limiter.acquire(job.channel, self._stop_event)
+            if self._stop_event.is_set():
+                # Трек остается в журнале до следующего запуска
+                unpin_track(track_data)
+                return
+            success = TelegramSender.send_track(track_data, chat_id=job.channel)
+            finish_job(track_data, success)
+            TRACKS_TOTAL.inc('sent' if success else 'failed')
+            if not success:
+                logger.warning(f"[{job.channel}] Ошибка отправки трека")
+            self._reschedule(job, success)
+        except Exception as e:
+            logger.error(f"[{job.channel}] Ошибка отправки: {e}")
+            self._reschedule(job, False)
+
+    async def _upload_async(self, job, track_data):
+        try:
+            delay = self.rate_limiter.reserve(job.channel)
+            STAGE_SECONDS.observe(max(delay, 0), 'rate_limit')
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._stop_event.is_set():
+                unpin_track(track_data)
+                return
+            success = await TelegramSender.send_track_async(track_data, chat_id=job.channel)
+            # fsync журнала не должен останавливать цикл asyncio
+            await asyncio.get_running_loop().run_in_executor(None, finish_job, track_data, success)
+            TRACKS_TOTAL.inc('sent' if success else 'failed')
+            if not success:
+                logger.warning(f"[{job.channel}] Ошибка отправки трека")
+            self._reschedule(job, success)
+        except Exception as e:
+            logger.error(f"[{job.channel}] Ошибка отправки: {e}")
+            self._reschedule(job, False)
+
+    def _run_job(self, job, upload_pool):
+        try:
+            if self._stop_event.is_set():
+                return
+            try:
+                track_data = self._download(job)
+            except RetryLater as e:
+                # Трек остается за заданием, пауза ждет в куче, а не в потоке загрузки
+                self._resume.setdefault(job.channel, deque()).appendleft(e.record)
+                logger.info(f"[{job.channel}] Загрузка: {e}")
+                job.next_due = time.monotonic() + e.delay
+                self._push(job)
+                return
+            if not track_data:
+                logger.warning(f"[{job.channel}] Ошибка загрузки трека")
+                self._reschedule(job, False)
+                return
+            if CONFIG['telegram_async_uploads']:
+                # Отправки идут в общем цикле asyncio, поток на каждую не нужен
+                future = get_async_runner().submit(self._upload_async(job, track_data))
+                self._async_uploads.add(future)
+                future.add_done_callback(self._async_uploads.discard)
+            else:
+                future = upload_pool.submit(self._upload, job, track_data)
+                # Отмененная при остановке отправка не должна держать запись аудиокэша
+                future.add_done_callback(lambda future: future.cancelled() and unpin_track(track_data))
+        except Exception as e:
+            logger.error(f"[{job.channel}] Ошибка задания: {e}")
+            self._reschedule(job, False)
+
+    def run(self):
+        """Выполняет задания до вызова stop()"""
+        self._stop_event.clear()
+        cleanup_temp_files()
+        for job in self.jobs:
+            if job.channel not in self._resume:
+                self._resume[job.channel] = deque(resume_jobs(job.channel))
+            self._push(job)
+        logger.info(f"Планировщик запущен, заданий: {len(self.jobs)}")
+
+        download_pool = ThreadPoolExecutor(CONFIG['download_workers'], thread_name_prefix='download')
+        upload_pool = ThreadPoolExecutor(CONFIG['upload_workers'], thread_name_prefix='upload')
+        try:
+            while not self._stop_event.is_set():
+                with self._condition:
+                    if not self._heap:
+                        self._condition.wait(1)
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay > 0:
+                        self._condition.wait(min(delay, 1))
+                        continue
+                    _, _, job = heapq.heappop(self._heap)
+
+                download_pool.submit(self._run_job, job, upload_pool)
+        finally:
+            download_pool.shutdown(wait=True, cancel_futures=True)
+            upload_pool.shutdown(wait=True, cancel_futures=True)
+            if self._async_uploads:
+                wait(list(self._async_uploads), timeout=60)
+            logger.info("Планировщик остановлен")
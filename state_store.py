@@ -0,0 +1,136 @@
+import atexit
+import sqlite3
+import logging
+from threading import Thread, Event, Lock
+
+logger = logging.getLogger('MusicBot')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    url TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    track_order TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    url TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (url, video_id)
+);
+CREATE TABLE IF NOT EXISTS history (
+    channel TEXT NOT NULL,
+    video_id TEXT,
+    artist TEXT,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_channel_time ON history (channel, played_at);
+CREATE INDEX IF NOT EXISTS history_channel_video ON history (channel, video_id);
+CREATE TABLE IF NOT EXISTS audio_cache (
+    video_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_ids (
+    bot_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    audio TEXT NOT NULL,
+    thumb TEXT,
+    PRIMARY KEY (bot_id, video_id)
+);
+CREATE TABLE IF NOT EXISTS failures (
+    video_id TEXT PRIMARY KEY,
+    class TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    until REAL NOT NULL,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS backfill (
+    channel TEXT NOT NULL,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (channel, url)
+);
+"""
+
+
+class StateStore:
+    """Единое хранилище состояния бота в SQLite (режим WAL).
+
+    Модули держат рабочее состояние в памяти и читают базу только при старте,
+    а изменения ставят в очередь: фоновый поток записывает накопленное одной
+    транзакцией, поэтому горячий путь не ждет коммитов.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = Lock()
+        self._pending = []
+        self._pending_lock = Lock()
+        self._wakeup = Event()
+        self._closed = Event()
+        self._thread = Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def query(self, sql, params=()):
+        """Читает строки (используется при загрузке состояния)"""
+        self.flush()
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        """Ставит изменение в очередь на пакетную запись"""
+        self._enqueue((sql, params, False))
+
+    def executemany(self, sql, rows):
+        self._enqueue((sql, list(rows), True))
+
+    def _enqueue(self, item):
+        with self._pending_lock:
+            self._pending.append(item)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        # Пакет забирается под общей блокировкой, чтобы пакеты не обгоняли друг друга
+        with self._lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self._conn.execute('BEGIN')
+                for sql, params, many in batch:
+                    if many:
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+                self._conn.execute('COMMIT')
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                logger.error(f"Ошибка записи состояния в {self.path}: {e}")
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wakeup.set()
+        self._thread.join(5)
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,156 @@
+import os
+import logging
+import tempfile
+import subprocess
+from queue import Queue, Empty
+from threading import Thread, Event
+import requests
+
+logger = logging.getLogger('MusicBot')
+
+# Кодек на выходе -> (энкодер ffmpeg, префикс acodec источника для копирования без перекодирования)
+CODECS = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'opus': ('libopus', 'opus'),
+    'm4a': ('aac', 'mp4a')
+}
+
+
+class StreamTranscodeError(Exception):
+    pass
+
+
+def can_stream(info):
+    """Поток можно читать напрямую: один формат, обычный HTTP"""
+    return (
+        bool(info.get('url'))
+        and not info.get('requested_formats')
+        and info.get('protocol', 'https') in ('http', 'https')
+    )
+
+
+def build_ffmpeg_command(out_path, codec, copy_audio, bitrate, metadata, source='pipe:0'):
+    encoder, _ = CODECS[codec]
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', source, '-vn']
+    if copy_audio:
+        command += ['-c:a', 'copy']
+    else:
+        command += ['-c:a', encoder, '-b:a', f"{bitrate}k"]
+    for key, value in metadata.items():
+        if value:
+            command += ['-metadata', f"{key}={value}"]
+    command.append(out_path)
+    return command
+
+
+def transcode_file(source, acodec, out_base, codec='mp3', bitrate=192, metadata=None, copy_audio=None):
+    """Перекодирует (или копирует) уже скачанный файл и возвращает путь к результату.
+
+    copy_audio=None - копировать, если кодек источника совпадает с нужным.
+    """
+    if codec not in CODECS:
+        raise StreamTranscodeError(f"Неподдерживаемый кодек: {codec}")
+    if copy_audio is None:
+        copy_audio = (acodec or '').startswith(CODECS[codec][1])
+    out_path = f"{out_base}.{codec}"
+    command = build_ffmpeg_command(out_path, codec, copy_audio, bitrate, metadata or {}, source=source)
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not os.path.exists(out_path):
+        raise StreamTranscodeError(
+            f"ffmpeg завершился с кодом {result.returncode}: {result.stderr.decode(errors='replace').strip()}"
+        )
+    return out_path
+
+
+class StreamTranscoder:
+    """Скачивание с передачей байтов прямо в ffmpeg, без промежуточного файла.
+
+    Сеть и ffmpeg развязаны ограниченной очередью чанков, поэтому в памяти
+    держится не больше buffer_chunks * chunk_size байт.
+    """
+
+    def __init__(self, buffer_chunks=32, chunk_size=256 * 1024, timeout=30, limiter=None):
+        self.buffer_chunks = buffer_chunks
+        self.limiter = limiter
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    def _read_stream(self, url, headers, buffer, stop_event, errors):
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(self.chunk_size):
+                    if stop_event.is_set():
+                        break
+                    if self.limiter:
+                        self.limiter.consume(len(chunk))
+                    buffer.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            buffer.put(None)
+
+    def transcode(self, info, out_base, codec='mp3', bitrate=192, metadata=None, copy_audio=None):
+        """Скачивает поток из info yt-dlp и возвращает путь к готовому файлу"""
+        if codec not in CODECS:
+            raise StreamTranscodeError(f"Неподдерживаемый кодек: {codec}")
+        if not can_stream(info):
+            raise StreamTranscodeError("Формат нельзя читать потоком")
+
+        if copy_audio is None:
+            copy_audio = (info.get('acodec') or '').startswith(CODECS[codec][1])
+        out_path = f"{out_base}.{codec}"
+        command = build_ffmpeg_command(out_path, codec, copy_audio, bitrate, metadata or {})
+
+        buffer = Queue(maxsize=self.buffer_chunks)
+        stop_event = Event()
+        errors = []
+        reader = Thread(
+            target=self._read_stream,
+            args=(info['url'], info.get('http_headers') or {}, buffer, stop_event, errors),
+            daemon=True
+        )
+
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+            reader.start()
+            try:
+                while (chunk := buffer.get()) is not None:
+                    process.stdin.write(chunk)
+                process.stdin.close()
+                returncode = process.wait()
+            except Exception as e:
+                # ffmpeg упал или закрыл вход: останавливаем чтение и освобождаем очередь
+                stop_event.set()
+                process.kill()
+                process.wait()
+                while True:
+                    try:
+                        if buffer.get(timeout=self.timeout) is None:
+                            break
+                    except Empty:
+                        break
+                self._remove(out_path)
+                raise StreamTranscodeError(f"Ошибка передачи данных в ffmpeg: {e}") from e
+
+            stderr.seek(0)
+            ffmpeg_errors = stderr.read().decode(errors='replace').strip()
+
+        reader.join(self.timeout)
+        if errors:
+            self._remove(out_path)
+            raise StreamTranscodeError(f"Ошибка чтения потока: {errors[0]}")
+        if returncode != 0 or not os.path.exists(out_path):
+            self._remove(out_path)
+            raise StreamTranscodeError(f"ffmpeg завершился с кодом {returncode}: {ffmpeg_errors}")
+
+        logger.info(f"Потоковое {'копирование' if copy_audio else 'перекодирование'} в {codec}: {out_path}")
+        return out_path
+
+    @staticmethod
+    def _remove(path):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
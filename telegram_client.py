@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+from threading import Lock, Thread
+import requests
+from requests.adapters import HTTPAdapter
+import telebot
+from telebot import apihelper
+from retry import PERMANENT, get_policy
+
+logger = logging.getLogger('MusicBot')
+
+_registry_lock = Lock()
+_clients = {}
+_async_runner = None
+
+
+def setup_http_session(pool_size):
+    """Общая keep-alive сессия requests для всех вызовов Bot API"""
+    with _registry_lock:
+        if apihelper.session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # telebot берет эту сессию во всех потоках вместо собственной на поток
+            apihelper.session = session
+    return apihelper.session
+
+
+def rewind_files(kwargs):
+    """Перематывает файлы перед повторной загрузкой, в том числе в альбоме"""
+    for value in kwargs.values():
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            for file in (item, getattr(item, 'media', None), getattr(item, 'thumbnail', None)):
+                if hasattr(file, 'seek'):
+                    file.seek(0)
+
+
+class TelegramClient:
+    """Долгоживущий клиент Bot API для одного токена с метриками вызовов"""
+
+    def __init__(self, token, retries=2, retry_settings=None):
+        self.token = token
+        self.retries = retries
+        self.retry_settings = retry_settings or {}
+        self.bot = telebot.TeleBot(token, threaded=False)
+        self._async_bot = None
+        self._lock = Lock()
+        self.metrics = {}
+
+    @property
+    def async_bot(self):
+        if self._async_bot is None:
+            # aiohttp нужен только для асинхронной отправки
+            from telebot.async_telebot import AsyncTeleBot
+            self._async_bot = AsyncTeleBot(self.token)
+        return self._async_bot
+
+    def _record(self, method, latency, retries, failed):
+        with self._lock:
+            stats = self.metrics.setdefault(method, {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_latency': 0.0,
+                'max_latency': 0.0
+            })
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['retries'] += retries
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+        logger.info(f"Bot API {method}: {latency:.2f} с, повторов: {retries}{', ошибка' if failed else ''}")
+
+    def stats(self):
+        """Сводка по методам: число вызовов, ошибок, повторов и задержки"""
+        with self._lock:
+            return {
+                method: dict(
+                    stats,
+                    avg_latency=stats['total_latency'] / stats['calls'] if stats['calls'] else 0.0
+                )
+                for method, stats in self.metrics.items()
+            }
+
+    def policy(self, kwargs):
+        """Политика повторов канала: лимиты Telegram действуют на каждый чат"""
+        return get_policy(f"telegram:{kwargs.get('chat_id')}", **self.retry_settings)
+
+    def should_retry(self, method, policy, error, retries):
+        """Возвращает паузу перед повтором или None, если ошибку нужно пробросить"""
+        kind, delay = policy.failure(error, retries)
+        # Долгие паузы (например, большой retry_after) ждет планировщик, а не этот поток
+        if kind == PERMANENT or retries >= self.retries or delay > policy.inline_max:
+            return None
+        logger.warning(f"Bot API {method}: {error} ({kind}), повтор {retries + 1} через {delay:.1f} с")
+        return delay
+
+    def call(self, method, **kwargs):
+        """Вызывает метод TeleBot с повторами по политике канала"""
+        started = time.monotonic()
+        retries = 0
+        policy = self.policy(kwargs)
+        while True:
+            try:
+                policy.check()
+                result = getattr(self.bot, method)(**kwargs)
+                policy.success()
+                self._record(method, time.monotonic() - started, retries, False)
+                return result
+            except Exception as e:
+                if (delay := self.should_retry(method, policy, e, retries)) is None:
+                    self._record(method, time.monotonic() - started, retries, True)
+                    raise
+                retries += 1
+                time.sleep(delay)
+                rewind_files(kwargs)
+
+    async def call_async(self, method, **kwargs):
+        """Асинхронный вариант call() через AsyncTeleBot"""
+        started = time.monotonic()
+        retries = 0
+        policy = self.policy(kwargs)
+        while True:
+            try:
+                policy.check()
+                result = await getattr(self.async_bot, method)(**kwargs)
+                policy.success()
+                self._record(method, time.monotonic() - started, retries, False)
+                return result
+            except Exception as e:
+                if (delay := self.should_retry(method, policy, e, retries)) is None:
+                    self._record(method, time.monotonic() - started, retries, True)
+                    raise
+                retries += 1
+                await asyncio.sleep(delay)
+                rewind_files(kwargs)
+
+
+class AsyncRunner:
+    """Фоновый цикл asyncio: много отправок одновременно без потока на каждую"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Планирует корутину и возвращает concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+def get_client(token, pool_size=10, retries=2, retry_settings=None):
+    """Возвращает единственный клиент для токена"""
+    setup_http_session(pool_size)
+    with _registry_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = TelegramClient(token, retries, retry_settings)
+            _clients[token] = client
+        client.retries = retries
+        client.retry_settings = retry_settings or {}
+        return client
+
+
+def get_async_runner():
+    global _async_runner
+    with _registry_lock:
+        if _async_runner is None:
+            _async_runner = AsyncRunner()
+        return _async_runner
@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+from threading import Thread, Event, Lock
+
+logger = logging.getLogger('MusicBot')
+
+# Недокачанные файлы моложе этого возраста переживают очистку: их докачивает следующая попытка
+PARTIAL_MAX_AGE = 24 * 3600
+PARTIAL_SUFFIXES = ('.part', '.part.json')
+
+
+def entry_size(path):
+    """Размер файла или каталога задания (каталоги заданий неглубокие)"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def has_fresh_partial(path, now):
+    """В каталоге (или сам файл) есть недокачанные данные моложе PARTIAL_MAX_AGE"""
+    names = os.listdir(path) if os.path.isdir(path) else [os.path.basename(path)]
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    for name in names:
+        if name.endswith(PARTIAL_SUFFIXES):
+            try:
+                if now - os.path.getmtime(os.path.join(folder, name)) < PARTIAL_MAX_AGE:
+                    return True
+            except OSError:
+                pass
+    return False
+
+
+class TempStorage:
+    """Временные файлы загрузок: у каждого задания свой каталог в root.
+
+    Пути файлов задание знает само, каталог root не сканируется при
+    загрузке. Занятые каталоги учитываются в памяти, файлы незавершенных
+    отправок возвращает keep (журнал). Остальное - сироты: их удаляет
+    фоновая очистка, а при превышении max_bytes каталоги вытесняются,
+    начиная с самых старых.
+    """
+
+    def __init__(self, root, max_bytes=0, keep=None):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.keep = keep or set
+        self._active = {}
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def allocate(self, key=None):
+        """Выдает пустой или оставшийся от прошлой попытки каталог задания.
+
+        Каталог по ключу (ID видео) переживает неудачную попытку и перезапуск,
+        поэтому недокачанный файл докачивается; занятый ключ получает суффикс.
+        """
+        name = key or uuid.uuid4().hex
+        with self._lock:
+            path = os.path.join(self.root, name)
+            if path in self._active:
+                path = os.path.join(self.root, f"{name}.{uuid.uuid4().hex[:8]}")
+            os.makedirs(path, exist_ok=True)
+            self._active[path] = time.time()
+        if self.max_bytes:
+            self.enforce_quota()
+        return path
+
+    def workspace(self, path):
+        """Каталог задания, которому принадлежит файл, или None"""
+        if not path:
+            return None
+        path = os.path.abspath(path)
+        if os.path.dirname(path) == self.root and (path in self._active or os.path.isdir(path)):
+            return path
+        folder = os.path.dirname(path)
+        return folder if os.path.dirname(folder) == self.root else None
+
+    def release(self, path):
+        """Освобождает каталог задания вместе с файлами.
+
+        Каталог с недавним недокачанным файлом остается для докачки,
+        его удалит фоновая очистка по возрасту.
+        """
+        if not (workspace := self.workspace(path)):
+            return
+        with self._lock:
+            self._active.pop(workspace, None)
+            try:
+                if os.path.isdir(workspace) and not has_fresh_partial(workspace, time.time()):
+                    shutil.rmtree(workspace)
+            except OSError as e:
+                logger.error(f"Ошибка удаления каталога {workspace}: {e}")
+
+    def _protected(self):
+        """Пути, которые нельзя удалять: занятые каталоги и файлы журнала"""
+        protected = set(self._active)
+        for path in self.keep():
+            protected.add(path)
+            protected.add(os.path.dirname(path))
+        return protected
+
+    def _orphans(self):
+        """Свободные записи root: (mtime, путь) от старых к новым"""
+        with self._lock:
+            protected = self._protected()
+        orphans = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.path in protected:
+                    continue
+                try:
+                    orphans.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        return sorted(orphans)
+
+    def _remove(self, path):
+        """Удаляет запись root, если ее не заняли за время обхода; возвращает освобожденные байты"""
+        with self._lock:
+            if path in self._protected() or not os.path.exists(path):
+                return 0
+            try:
+                size = entry_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+                return size
+            except OSError as e:
+                logger.error(f"Ошибка удаления {path}: {e}")
+                return 0
+
+    def collect(self):
+        """Удаляет сирот, кроме свежих недокачанных; возвращает освобожденные байты"""
+        freed = 0
+        now = time.time()
+        for _, path in self._orphans():
+            try:
+                if has_fresh_partial(path, now):
+                    continue
+            except OSError:
+                continue
+            freed += self._remove(path)
+        if freed:
+            logger.info(f"Временные файлы: очищено {freed / 1024 / 1024:.1f} МБ")
+        return freed
+
+    def usage(self):
+        total = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    total += entry_size(entry.path)
+                except OSError:
+                    pass
+        return total
+
+    def enforce_quota(self):
+        """Вытесняет свободные каталоги, включая недокачанные, пока объем больше max_bytes"""
+        if not self.max_bytes or (used := self.usage()) <= self.max_bytes:
+            return
+        for _, path in self._orphans():
+            if used <= self.max_bytes:
+                break
+            if freed := self._remove(path):
+                used -= freed
+                logger.info(f"Временные файлы: вытеснен {os.path.basename(path)}")
+        if used > self.max_bytes:
+            logger.warning(
+                f"Временные файлы занимают {used / 1024 / 1024:.0f} МБ при лимите "
+                f"{self.max_bytes / 1024 / 1024:.0f} МБ: остальное занято заданиями"
+            )
+
+    def start(self, interval):
+        """Запускает фоновую очистку раз в interval секунд"""
+        if self._thread is not None or not interval:
+            return
+        self._thread = Thread(target=self._gc_loop, args=(interval,), daemon=True, name='temp-gc')
+        self._thread.start()
+
+    def _gc_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.collect()
+                self.enforce_quota()
+            except Exception as e:
+                logger.error(f"Ошибка очистки временных файлов: {e}")
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(5)
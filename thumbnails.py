@@ -0,0 +1,141 @@
+import os
+import logging
+import subprocess
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+import requests
+from metrics import CACHE_TOTAL, STAGE_SECONDS
+from stream_transcode import StreamTranscodeError
+
+logger = logging.getLogger('MusicBot')
+
+# Требования Bot API к обложке аудио: JPEG не больше 320 px по стороне и 200 КБ
+MAX_SIDE = 320
+MAX_BYTES = 200 * 1024
+# Качество JPEG для ffmpeg (-q:v, меньше - лучше), пробуется по порядку до укладки в лимит
+JPEG_QUALITIES = (3, 6, 10, 15)
+
+
+def run_ffmpeg(command):
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise StreamTranscodeError(result.stderr.decode(errors='replace').strip())
+
+
+def normalize_thumbnail(source, dest, max_side=MAX_SIDE, max_bytes=MAX_BYTES):
+    """Уменьшает обложку до max_side и пережимает в JPEG не больше max_bytes"""
+    scale = f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease"
+    for quality in JPEG_QUALITIES:
+        run_ffmpeg([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', source,
+            '-vf', scale, '-frames:v', '1', '-q:v', str(quality), '-f', 'mjpeg', dest
+        ])
+        if os.path.getsize(dest) <= max_bytes:
+            return dest
+    logger.warning(f"Обложка {dest} больше {max_bytes // 1024} КБ даже при сильном сжатии")
+    return dest
+
+
+def embed_cover(audio_path, cover_path):
+    """Встраивает обложку в mp3 (ID3 APIC) без перекодирования звука"""
+    if not audio_path.endswith('.mp3'):
+        return False
+    tmp_path = f"{audio_path}.cover.mp3"
+    try:
+        run_ffmpeg([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', audio_path, '-i', cover_path,
+            '-map', '0:a', '-map', '1:v', '-c', 'copy', '-id3v2_version', '3',
+            '-metadata:s:v', 'title=Album cover', '-metadata:s:v', 'comment=Cover (front)',
+            '-disposition:v', 'attached_pic', tmp_path
+        ])
+        os.replace(tmp_path, audio_path)
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось встроить обложку в {audio_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+class ThumbnailCache:
+    """Обложки, приведенные к требованиям Telegram, по ID видео.
+
+    Загрузка и обработка идут в отдельном пуле параллельно со скачиванием
+    аудио; одновременные запросы одной обложки объединяются. Готовую
+    обложку забирает аудиокэш вместе с треком, здесь она лежит до этого;
+    обложку трека, который не удалось скачать, загрузка удаляет (discard).
+    """
+
+    def __init__(self, folder, workers=4, timeout=30, max_side=MAX_SIDE):
+        self.folder = folder
+        self.workers = workers
+        self.timeout = timeout
+        self.max_side = max_side
+        self._lock = Lock()
+        self._pending = {}
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='thumbnail')
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, video_id):
+        return os.path.join(self.folder, f"{video_id}.jpg")
+
+    def get(self, video_id):
+        """Путь к готовой обложке или None"""
+        path = self.path(video_id)
+        return path if video_id and os.path.exists(path) else None
+
+    def fetch(self, video_id, url):
+        """Запускает загрузку обложки; Future вернет путь к JPEG или None"""
+        with self._lock:
+            if path := self.get(video_id):
+                CACHE_TOTAL.inc('thumbnail', 'hit')
+                future = Future()
+                future.set_result(path)
+                return future
+            if future := self._pending.get(video_id):
+                return future
+            CACHE_TOTAL.inc('thumbnail', 'miss')
+            future = self._pool.submit(self._process, video_id, url)
+            self._pending[video_id] = future
+        future.add_done_callback(lambda _: self._forget(video_id))
+        return future
+
+    def discard(self, video_id):
+        """Удаляет обложку трека, не попавшего в аудиокэш; незавершенную - по готовности"""
+        with self._lock:
+            future = self._pending.get(video_id)
+        if future:
+            future.add_done_callback(lambda _: self._remove(video_id))
+        else:
+            self._remove(video_id)
+
+    def _remove(self, video_id):
+        with suppress(FileNotFoundError):
+            os.remove(self.path(video_id))
+
+    def _forget(self, video_id):
+        with self._lock:
+            self._pending.pop(video_id, None)
+
+    def _process(self, video_id, url):
+        path = self.path(video_id)
+        source_path = f"{path}.source"
+        tmp_path = f"{path}.tmp"
+        try:
+            with STAGE_SECONDS.time('thumbnail'):
+                response = requests.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                with open(source_path, 'wb') as f:
+                    f.write(response.content)
+                normalize_thumbnail(source_path, tmp_path, self.max_side)
+                os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            logger.warning(f"Не удалось подготовить обложку {video_id}: {e}")
+            return None
+        finally:
+            for leftover in (source_path, tmp_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
@@ -0,0 +1,212 @@
+import time
+import random
+import logging
+from collections import deque
+from itertools import islice
+from threading import Lock
+
+logger = logging.getLogger('MusicBot')
+
+
+class ShuffledCycle:
+    """Перемешанный обход плейлиста: каждый трек выпадает раз за цикл"""
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.signature = self.make_signature(tracks)
+        self.order = list(range(len(tracks)))
+        random.shuffle(self.order)
+        self.cursor = 0
+
+    @staticmethod
+    def make_signature(tracks):
+        # Состав плейлиста: обновление кэша с теми же треками не сбрасывает круг
+        return hash(tuple(sorted(track.get('id') or '' for track in tracks)))
+
+    def adopt(self, tracks):
+        """Переходит на новый снимок того же состава, сохраняя порядок и позицию круга"""
+        positions = {}
+        for index, track in enumerate(tracks):
+            positions.setdefault(track.get('id') or '', []).append(index)
+        self.order = [positions[self.tracks[index].get('id') or ''].pop() for index in self.order]
+        self.tracks = tracks
+
+    def restart(self):
+        """Начинает новый круг с перемешиванием"""
+        random.shuffle(self.order)
+        self.cursor = 0
+
+    @property
+    def remaining(self):
+        """Сколько треков осталось в текущем круге; в начале нового круга - перемешивание"""
+        if self.cursor >= len(self.order):
+            self.restart()
+        return len(self.order) - self.cursor
+
+    def peek(self, offset):
+        """Трек через offset позиций от курсора"""
+        return self.tracks[self.order[self.cursor + offset]]
+
+    def take(self, offset):
+        """Забирает трек со смещением offset, оставляя пропущенные в текущем круге"""
+        position = self.cursor + offset
+        self.order[self.cursor], self.order[position] = self.order[position], self.order[self.cursor]
+        index = self.order[self.cursor]
+        self.cursor += 1
+        return self.tracks[index]
+
+
+class PlayHistory:
+    """История выборов по каналам в хранилище состояния"""
+
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self._channels = {}
+        self._last_played = {}
+        self._load()
+
+    def _load(self):
+        try:
+            for channel, video_id, artist, played_at in self.store.query(
+                'SELECT channel, video_id, artist, played_at FROM history ORDER BY played_at'
+            ):
+                self._append(channel, (video_id, artist, played_at))
+        except Exception as e:
+            logger.error(f"Ошибка чтения истории отправок: {e}")
+
+    def _append(self, channel, item):
+        items = self._channels.setdefault(channel, deque(maxlen=self.size))
+        last_played = self._last_played.setdefault(channel, {})
+        if len(items) == items.maxlen:
+            old_id, _, old_time = items[0]
+            if last_played.get(old_id) == old_time:
+                del last_played[old_id]
+        items.append(item)
+        last_played[item[0]] = item[2]
+        return items
+
+    def recent(self, channel, count):
+        """Последние count выборов канала: (video_id, artist, время)"""
+        items = self._channels.get(channel, ())
+        return list(islice(reversed(items), count))
+
+    def last_played(self, channel, video_id):
+        """Время последнего выбора трека или None"""
+        return self._last_played.get(channel, {}).get(video_id)
+
+    def add(self, channel, track):
+        item = (track.get('id'), track.get('artist'), time.time())
+        items = self._append(channel, item)
+        self.store.execute(
+            'INSERT INTO history (channel, video_id, artist, played_at) VALUES (?, ?, ?, ?)',
+            (channel, *item)
+        )
+        if len(items) == items.maxlen:
+            # В базе держим столько же, сколько в памяти
+            self.store.execute('DELETE FROM history WHERE channel = ? AND played_at < ?', (channel, items[0][2]))
+
+
+class TrackSelector:
+    """Выбор трека за O(1): перемешанный цикл, окно без повторов и веса.
+
+    На каждом шаге рассматривается не больше lookahead кандидатов от курсора
+    цикла, поэтому время выбора не зависит от размера плейлиста.
+    """
+
+    # История хранится дольше окна без повторов, чтобы учитывать давность выбора
+    HISTORY_SIZE = 1000
+
+    def __init__(self, store, window=50, lookahead=8):
+        self.history = PlayHistory(store, self.HISTORY_SIZE)
+        self.window = window
+        self.lookahead = lookahead
+        self.recency_hours = 0
+        self.min_duration = 0
+        self.max_duration = 0
+        self.artist_spread = 0
+        self.cached_weight = 1.0
+        self._cycles = {}
+        self._lock = Lock()
+
+    def _cycle(self, channel, playlist, tracks):
+        key = (channel, playlist)
+        cycle = self._cycles.get(key)
+        if cycle is None or (cycle.tracks is not tracks and cycle.signature != ShuffledCycle.make_signature(tracks)):
+            cycle = ShuffledCycle(tracks)
+            self._cycles[key] = cycle
+        elif cycle.tracks is not tracks:
+            # Новый снимок с тем же составом: круг продолжается по нему
+            cycle.adopt(tracks)
+        return cycle
+
+    def _allowed(self, track, recent_ids, dead_ids):
+        video_id = track.get('id')
+        if video_id in dead_ids or video_id in recent_ids:
+            return False
+        duration = track.get('duration') or 0
+        if self.min_duration and duration and duration < self.min_duration:
+            return False
+        if self.max_duration and duration > self.max_duration:
+            return False
+        return True
+
+    def _weight(self, track, channel, recent_artists, is_cached):
+        weight = 1.0
+        if self.recency_hours:
+            # Недавно звучавшие треки постепенно возвращают полный вес
+            if (played := self.history.last_played(channel, track.get('id'))) is not None:
+                hours = (time.time() - played) / 3600
+                weight *= max(0.05, min(1.0, hours / self.recency_hours))
+        if self.cached_weight != 1.0 and is_cached(track.get('id')):
+            weight *= self.cached_weight
+        if track.get('artist') in recent_artists:
+            weight *= 0.2
+        return weight
+
+    def _candidates(self, cycle, recent_ids, dead_ids):
+        """Кандидаты от курсора: (смещение, трек).
+
+        Если окно без повторов не дает выбора (короткий плейлист), ослабляется
+        только оно; недоступные треки и ограничения длительности действуют всегда.
+        """
+        for window_ids in (recent_ids, ()):
+            candidates = []
+            for offset in range(min(cycle.remaining, self.lookahead * 4)):
+                track = cycle.peek(offset)
+                if not self._allowed(track, window_ids, dead_ids):
+                    continue
+                candidates.append((offset, track))
+                if len(candidates) >= self.lookahead:
+                    break
+            if candidates:
+                return candidates
+        return []
+
+    def select(self, tracks, channel, playlist=None, dead_ids=frozenset(), is_cached=lambda video_id: False):
+        """Выбирает трек и записывает его в историю канала; None - выбрать нечего.
+
+        Круг обхода свой у каждой пары канал - плейлист.
+        """
+        if not tracks:
+            return None
+        with self._lock:
+            cycle = self._cycle(channel, playlist, tracks)
+            recent_ids = {item[0] for item in self.history.recent(channel, self.window)}
+            recent_artists = {item[1] for item in self.history.recent(channel, self.artist_spread)}
+
+            candidates = self._candidates(cycle, recent_ids, dead_ids)
+            if not candidates and cycle.cursor:
+                # В конце круга копятся пропущенные треки: недоступные и не
+                # подходящие по длительности. Начинаем новый круг, а не ждем
+                # обновления плейлиста
+                cycle.restart()
+                candidates = self._candidates(cycle, recent_ids, dead_ids)
+            if not candidates:
+                return None
+
+            weights = [self._weight(track, channel, recent_artists, is_cached) for _, track in candidates]
+            offset, _ = random.choices(candidates, weights=weights)[0]
+            track = cycle.take(offset)
+            self.history.add(channel, track)
+            return track
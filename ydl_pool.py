@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+from contextlib import contextmanager
+from threading import Lock
+import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+
+logger = logging.getLogger('MusicBot')
+
+# Параметры, которые меняются от вызова к вызову и не требуют пересоздания
+VOLATILE_OPTS = ('logger', 'outtmpl')
+
+
+def opts_fingerprint(opts):
+    """Отпечаток параметров yt-dlp: при его изменении экземпляры пересоздаются"""
+    # Изменение файла cookies экземпляры не пересоздает: общий набор перечитывается на месте
+    stable = {key: value for key, value in opts.items() if key not in VOLATILE_OPTS}
+    return json.dumps(stable, sort_keys=True, default=str)
+
+
+class SharedCookieJar:
+    """Файл cookies, разобранный один раз и общий для всех экземпляров yt-dlp.
+
+    При изменении файла новый набор читается в отдельный объект и
+    подменяется под блокировкой самого набора, поэтому запросы видят либо
+    старые cookies, либо новые целиком. Обратно в файл cookies не пишутся.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jar = YoutubeDLCookieJar(path)
+        self._stamp = None
+        self._lock = Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Перечитывает файл, если он изменился; возвращает общий набор"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return self.jar
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return self.jar
+        with self._lock:
+            if stamp != self._stamp:
+                fresh = YoutubeDLCookieJar(self.path)
+                try:
+                    fresh.load()
+                    with self.jar._cookies_lock:
+                        self.jar._cookies = fresh._cookies
+                    logger.info(f"Cookies загружены из {self.path}: {len(self.jar)}")
+                except Exception as e:
+                    logger.warning(f"Не удалось прочитать cookies из {self.path}: {e}")
+                self._stamp = stamp
+        return self.jar
+
+
+def set_outtmpl(ydl, outtmpl):
+    """Меняет шаблон имени файла у уже созданного экземпляра"""
+    ydl.params['outtmpl'] = outtmpl
+    if hasattr(ydl, '_parse_outtmpl'):
+        ydl._parse_outtmpl()
+    else:
+        ydl.outtmpl_dict = ydl.parse_outtmpl()
+
+
+def set_audio_format(ydl, codec, bitrate=None):
+    """Меняет кодек и битрейт FFmpegExtractAudio у уже созданного экземпляра.
+
+    bitrate=None - источник копируется, битрейт не нужен.
+    """
+    for postprocessors in ydl._pps.values():
+        for postprocessor in postprocessors:
+            if isinstance(postprocessor, FFmpegExtractAudioPP):
+                postprocessor.mapping = codec
+                if bitrate:
+                    postprocessor._preferredquality = float(bitrate)
+
+
+def close_ydl(ydl):
+    try:
+        if hasattr(ydl, 'close'):
+            ydl.close()
+        else:
+            ydl.__exit__(None, None, None)
+    except Exception as e:
+        logger.warning(f"Ошибка закрытия экземпляра yt-dlp: {e}")
+
+
+class YDLPool:
+    """Пул долгоживущих экземпляров yt_dlp.YoutubeDL по ролям.
+
+    Экземпляр не потокобезопасен, поэтому выдается в монопольное
+    пользование; свободные экземпляры переиспользуются, пока не изменятся
+    параметры (формат, путь к cookies и т.д.). Cookies всех экземпляров -
+    один набор в памяти на файл.
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._lock = Lock()
+        self._idle = {}
+        self._fingerprints = {}
+        self._jars = {}
+
+    def cookie_jar(self, path):
+        """Общий набор cookies файла с проверкой изменений"""
+        path = os.path.abspath(path)
+        with self._lock:
+            shared = self._jars.get(path)
+            if shared is None:
+                shared = self._jars[path] = SharedCookieJar(path)
+        return shared.refresh()
+
+    @contextmanager
+    def acquire(self, role, opts):
+        fingerprint = opts_fingerprint(opts)
+        ydl = None
+        stale = []
+        with self._lock:
+            if self._fingerprints.get(role) != fingerprint:
+                stale = self._idle.pop(role, [])
+                self._fingerprints[role] = fingerprint
+                if stale:
+                    logger.info(f"Параметры yt-dlp ({role}) изменились, пересоздаем экземпляры")
+            idle = self._idle.setdefault(role, [])
+            if idle:
+                ydl = idle.pop()
+                self.reused += 1
+
+        for old in stale:
+            close_ydl(old)
+
+        cookiefile = opts.get('cookiefile')
+        jar = self.cookie_jar(cookiefile) if cookiefile else None
+        if ydl is None:
+            if jar is not None:
+                # Без cookiefile yt-dlp не разбирает файл сам и не перезаписывает его при закрытии
+                opts = {key: value for key, value in opts.items() if key != 'cookiefile'}
+            ydl = yt_dlp.YoutubeDL(opts)
+            if jar is not None:
+                # cookiejar у YoutubeDL - cached_property: значение экземпляра заменяет загрузку
+                ydl.cookiejar = jar
+            with self._lock:
+                self.created += 1
+
+        broken = False
+        try:
+            yield ydl
+        except BaseException:
+            # После сбоя состояние экземпляра не гарантируется
+            broken = True
+            raise
+        finally:
+            with self._lock:
+                idle = self._idle.setdefault(role, [])
+                keep = (
+                    not broken
+                    and self._fingerprints.get(role) == fingerprint
+                    and len(idle) < self.max_idle
+                )
+                if keep:
+                    idle.append(ydl)
+            if not keep:
+                close_ydl(ydl)
+
+    def clear(self):
+        """Закрывает все свободные экземпляры"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._fingerprints = {}
+        for instances in idle.values():
+            for ydl in instances:
+                close_ydl(ydl)